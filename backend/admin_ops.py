@@ -0,0 +1,106 @@
+import os
+from datetime import datetime
+
+import stats
+
+# ── Admin write operations, single and bulk ────────────────────
+#  Both the one-id endpoints and the /bulk variants go through these, so
+#  tier history, notifications and stats deltas are identical either way.
+#  Each call reads its rows in chunks, queues the writes, and issues them
+#  with executemany inside the caller's transaction; the caller commits
+#  and then invalidates the returned user ids.
+
+BULK_MAX   = int(os.environ.get("ADMIN_BULK_MAX", 1000))
+_IN_CHUNK  = 500   # stay well under SQLite's bound-parameter limit
+
+
+def _unique(ids) -> list:
+    return list(dict.fromkeys(ids))
+
+def _fetch(db, sql, ids) -> dict:
+    found = {}
+    for i in range(0, len(ids), _IN_CHUNK):
+        chunk = ids[i:i + _IN_CHUNK]
+        marks = ",".join("?" * len(chunk))
+        for r in db.execute(sql.format(marks), chunk).fetchall():
+            found[r["id"]] = dict(r)
+    return found
+
+def _add(deltas, more):
+    for k, v in more.items():
+        deltas[k] = deltas.get(k, 0) + v
+
+
+def _write(db, tiers, history, notes):
+    if tiers:
+        db.executemany("UPDATE users SET tier=? WHERE id=?", tiers)
+    if history:
+        db.executemany("INSERT INTO tier_changes (user_id,old_tier,new_tier,changed_by,note) VALUES (?,?,?,?,?)",
+                       history)
+    if notes:
+        db.executemany("INSERT INTO notifications (user_id,type,message) VALUES (?,?,?)", notes)
+
+
+# returns (per-item results, user ids to invalidate)
+def change_tiers(db, changed_by: str, user_ids, new_tier: str, note: str = ""):
+    ids   = _unique(user_ids)
+    users = _fetch(db, "SELECT id,tier FROM users WHERE id IN ({})", ids)
+    results, deltas = [], {}
+    tiers, history, notes = [], [], []
+    for uid in ids:
+        user = users.get(uid)
+        if not user:
+            results.append({"id": uid, "ok": False, "error": "User not found"})
+            continue
+        tiers.append((new_tier, uid))
+        history.append((uid, user["tier"], new_tier, changed_by, note or ""))
+        notes.append((uid, "tier_changed", f"Your plan has been updated to {new_tier.title()}."))
+        _add(deltas, {**stats.tier_delta(user["tier"], new_tier), "unread_notifs": 1})
+        results.append({"id": uid, "ok": True, "old_tier": user["tier"], "new_tier": new_tier})
+    _write(db, tiers, history, notes)
+    stats.apply(db, deltas)
+    return results, [r["id"] for r in results if r["ok"]]
+
+
+# action is "approve" or "reject"
+def resolve_requests(db, changed_by: str, request_ids, action: str, note: str = ""):
+    ids  = _unique(request_ids)
+    reqs = _fetch(db, "SELECT * FROM sub_requests WHERE id IN ({})", ids)
+    # a user's tier as of the previous approval in this batch, so history chains correctly
+    current = {}
+    if action == "approve":
+        uids    = _unique(r["user_id"] for r in reqs.values())
+        current = {uid: u["tier"] for uid, u in _fetch(db, "SELECT id,tier FROM users WHERE id IN ({})", uids).items()}
+
+    now = datetime.utcnow().isoformat()
+    results, deltas, touched = [], {}, []
+    resolved, tiers, history, notes = [], [], [], []
+    for rid in ids:
+        req = reqs.get(rid)
+        if not req:
+            results.append({"id": rid, "ok": False, "error": "Request not found"})
+            continue
+        uid, want = req["user_id"], req["requested_tier"]
+        resolved.append((action + "d", note or "", now, rid))
+        _add(deltas, {"pending_reqs": -1 if req["status"] == "pending" else 0, "unread_notifs": 1})
+
+        if action == "approve":
+            old = current.get(uid, "free")
+            if uid in current:
+                _add(deltas, stats.tier_delta(old, want))
+                current[uid] = want
+            tiers.append((want, uid))
+            history.append((uid, old, want, changed_by, note or ""))
+            notes.append((uid, "tier_approved",
+                          f"🎉 Your {want.title()} plan is now active! Enjoy your new features."))
+        else:
+            notes.append((uid, "tier_rejected",
+                          f"Your {want.title()} request was not approved. {note or 'Contact admin for details.'}"))
+        results.append({"id": rid, "ok": True, "user_id": uid, "status": action + "d"})
+        touched.append(uid)
+
+    if resolved:
+        db.executemany("UPDATE sub_requests SET status=?,admin_note=?,resolved_at=? WHERE id=?", resolved)
+    _write(db, tiers, history, notes)
+    stats.apply(db, deltas)
+    return results, _unique(touched)
@@ -1,15 +1,51 @@
-import os, bcrypt, jwt
+import os, time, asyncio, threading, bcrypt, jwt
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from fastapi import HTTPException
 from database import get_db, row_to_dict
+import store as backends
 
 SECRET_KEY   = os.environ.get("SECRET_KEY", "t3n28-football-secret-change-in-prod")
 ALGORITHM    = "HS256"
 TOKEN_DAYS   = 30
 ADMIN_EMAIL  = os.environ.get("ADMIN_EMAIL", "chidhungwanaroy4@gmail.com")
 
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 30))
+USER_CACHE_MAX = int(os.environ.get("USER_CACHE_MAX", 50000))
+USER_SYNC_SECS = float(os.environ.get("USER_SYNC_SECS", 1))   # how often other workers' invalidations are picked up
+
+BCRYPT_ROUNDS    = int(os.environ.get("BCRYPT_ROUNDS", 12))
+HASH_WORKERS     = int(os.environ.get("HASH_WORKERS", 2))
+HASH_MAX_PENDING = int(os.environ.get("HASH_MAX_PENDING", 16))   # running + queued before 429
+HASH_RETRY_AFTER = int(os.environ.get("HASH_RETRY_AFTER", 2))
+
 DAILY_LIMITS = {"free": 50, "starter": 200, "pro": 500, "premium": 2000}
 CACHE_TTL    = {"free": 600, "starter": 300, "pro": 120, "premium": 60}
 
+# Per-endpoint TTL policy (seconds). None = follow the tier's CACHE_TTL;
+# a number pins slow-changing resources regardless of tier.
+ENDPOINT_TTL = {
+    "fixtures?live":       None,
+    "fixtures":            None,
+    "fixtures/events":     None,
+    "fixtures/statistics": None,
+    "fixtures/lineups":    1800,
+    "fixtures/rounds":     6 * 3600,
+    "fixtures/headtohead": 6 * 3600,
+    "standings":           3600,
+    "injuries":            3600,
+    "odds":                1800,
+    "predictions":         6 * 3600,
+    "players/topscorers":  3 * 3600,
+    "players":             6 * 3600,
+    "teams/statistics":    6 * 3600,
+    "teams":               24 * 3600,
+    "leagues":             24 * 3600,
+    "venues":              24 * 3600,
+    "countries":           7 * 86400,
+    "timezone":            7 * 86400,
+}
+
 TIERS = {
     "free":    {"label": "Free",    "price": 0,  "color": "#64748b",
                 "telegram": False, "channels": 0, "league_type": "non-top15",
@@ -35,12 +71,84 @@ TIERS = {
 
 TOP15_LEAGUE_IDS = [39,140,135,78,61,2,3,88,94,144,253,45,848,4,1]
 
-def hash_password(pw: str) -> str:
-    return bcrypt.hashpw(pw.encode(), bcrypt.gensalt()).decode()
+def get_ttl(endpoint: str, params: dict, tier: str) -> int:
+    tier_ttl = CACHE_TTL.get(tier, 600)
+    if "live" in params and endpoint + "?live" in ENDPOINT_TTL:
+        ttl = ENDPOINT_TTL[endpoint + "?live"]
+    else:
+        ttl = ENDPOINT_TTL.get(endpoint)
+    return tier_ttl if ttl is None else ttl
+
+def hash_password(pw: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return bcrypt.hashpw(pw.encode(), bcrypt.gensalt(rounds)).decode()
 
 def verify_password(pw: str, hashed: str) -> bool:
     return bcrypt.checkpw(pw.encode(), hashed.encode())
 
+def needs_rehash(hashed: str) -> bool:
+    # "$2b$12$..." — the cost is the second field
+    try:
+        return int(hashed.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+# ── Password hashing pool ──────────────────────────────────────
+#  bcrypt runs in a small process pool so a login surge can't starve the
+#  request threadpool; past HASH_MAX_PENDING callers get 429 + Retry-After.
+_hash_pool  = None
+_hash_stats = {"pending": 0, "count": 0, "rejected": 0, "total": 0.0, "max": 0.0}
+
+def start_hash_pool():
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ProcessPoolExecutor(HASH_WORKERS)
+        # fork the workers now, at startup, rather than mid-request
+        for _ in range(HASH_WORKERS):
+            _hash_pool.submit(int)
+
+def stop_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False, cancel_futures=True)
+        _hash_pool = None
+
+async def _run_hash(fn, *args):
+    if _hash_stats["pending"] >= HASH_MAX_PENDING:
+        _hash_stats["rejected"] += 1
+        raise HTTPException(429, "Too many sign-ins right now — try again shortly",
+                            headers={"Retry-After": str(HASH_RETRY_AFTER)})
+    start_hash_pool()
+    _hash_stats["pending"] += 1
+    t0 = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_pool, fn, *args)
+    finally:
+        took = time.perf_counter() - t0
+        _hash_stats["pending"] -= 1
+        _hash_stats["count"]   += 1
+        _hash_stats["total"]   += took
+        _hash_stats["max"]      = max(_hash_stats["max"], took)
+
+async def hash_password_async(pw: str) -> str:
+    return await _run_hash(hash_password, pw, BCRYPT_ROUNDS)
+
+async def verify_password_async(pw: str, hashed: str) -> bool:
+    return await _run_hash(verify_password, pw, hashed)
+
+def hash_stats() -> dict:
+    n = _hash_stats["count"]
+    return {
+        "rounds":      BCRYPT_ROUNDS,
+        "workers":     HASH_WORKERS,
+        "max_pending": HASH_MAX_PENDING,
+        "in_flight":   _hash_stats["pending"],
+        "queued":      max(0, _hash_stats["pending"] - HASH_WORKERS),
+        "rejected":    _hash_stats["rejected"],
+        "count":       n,
+        "avg_ms":      round(_hash_stats["total"] / n * 1000, 1) if n else 0.0,
+        "max_ms":      round(_hash_stats["max"] * 1000, 1),
+    }
+
 def create_token(user_id: int, email: str, tier: str) -> str:
     return jwt.encode({
         "sub":   str(user_id),
@@ -55,18 +163,72 @@ def decode_token(token: str):
     except Exception:
         return None
 
-def get_user_by_id(uid: int):
-    db = get_db()
-    row = db.execute("SELECT * FROM users WHERE id=?", (uid,)).fetchone()
-    db.close()
+# pass the request's connection (database.db_session) to reuse it
+def get_user_by_id(uid: int, db=None):
+    conn = db or get_db()
+    row  = conn.execute("SELECT * FROM users WHERE id=?", (uid,)).fetchone()
+    if db is None: conn.close()
     return row_to_dict(row)
 
-def get_user_by_email(email: str):
-    db = get_db()
-    row = db.execute("SELECT * FROM users WHERE email=?", (email.lower(),)).fetchone()
-    db.close()
+def get_user_by_email(email: str, db=None):
+    conn = db or get_db()
+    row  = conn.execute("SELECT * FROM users WHERE email=?", (email.lower(),)).fetchone()
+    if db is None: conn.close()
     return row_to_dict(row)
 
+# ── Authenticated-user cache ───────────────────────────────────
+#  uid -> (expires, user). Admin writes to tier/status call invalidate_user so
+#  upgrades and disables apply at once; the TTL bounds staleness elsewhere.
+#  A row read before an invalidation is never cached after it (generation
+#  check), and invalidate_user bumps the store's users_version, which every
+#  worker compares every USER_SYNC_SECS (sync_users) to drop its own copies.
+_user_cache = {}
+_user_gen   = {}   # uid -> invalidations seen by this worker
+_user_lock  = threading.Lock()
+_users_sync = {"version": None, "checked": 0.0, "epoch": 0}
+
+def cached_user(uid: int):
+    hit = _user_cache.get(uid)
+    return hit[1] if hit and hit[0] > time.monotonic() else None
+
+def get_user_cached(uid: int):
+    user = cached_user(uid)
+    if user:
+        return user
+    seen = (_user_gen.get(uid, 0), _users_sync["epoch"])
+    user = get_user_by_id(uid)
+    if user:
+        with _user_lock:
+            if (_user_gen.get(uid, 0), _users_sync["epoch"]) == seen:
+                if len(_user_cache) >= USER_CACHE_MAX:
+                    _user_cache.clear()
+                _user_cache[uid] = (time.monotonic() + USER_CACHE_TTL, user)
+    return user
+
+# call after the change is committed
+def invalidate_user(uid: int):
+    with _user_lock:
+        _user_gen[uid] = _user_gen.get(uid, 0) + 1
+        _user_cache.pop(uid, None)
+    try:
+        backends.get().counter_bump("users_version")
+    except Exception as e:   # other workers still drop it within USER_CACHE_TTL
+        print(f"⚠️  users_version bump failed: {e!r}")
+
+def users_sync_due() -> bool:
+    return time.monotonic() - _users_sync["checked"] >= USER_SYNC_SECS
+
+# blocking (store read); some worker changed a user since we last looked → drop everything
+def sync_users():
+    version = backends.get().counter_get("users_version")
+    with _user_lock:
+        if version != _users_sync["version"]:
+            if _users_sync["version"] is not None:
+                _user_cache.clear()
+                _users_sync["epoch"] += 1
+            _users_sync["version"] = version
+        _users_sync["checked"] = time.monotonic()
+
 def is_admin(email: str) -> bool:
     return email.lower() == ADMIN_EMAIL.lower()
 
@@ -0,0 +1,74 @@
+import os, sys, time, asyncio, tempfile, statistics
+
+# ── Event-loop blocking: sqlite on the loop vs database.run_db ─────
+#  cd backend && python bench/db_async.py [requests-per-level]
+#  Each simulated request does one usage-style UPSERT + commit. "inline"
+#  runs it on the event loop (what football_proxy used to do); "run_db"
+#  hands it to the DB executor. A 1 ms heartbeat task measures how long
+#  the loop stalls — that stall is added to every other in-flight request.
+
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("DB_SYNCHRONOUS", "FULL")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import get_db, init_db, run_db
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+
+
+def write(i: int):
+    db = get_db()
+    db.execute("""
+        INSERT INTO api_daily_total (date,total,cache_hits,real_calls) VALUES (?,1,0,0)
+        ON CONFLICT(date) DO UPDATE SET total=total+1
+    """, (f"bench-{i % 50}",))
+    db.commit(); db.close()
+
+
+async def request(mode: str, i: int):
+    await asyncio.sleep(0)            # stand-in for network/await points
+    if mode == "inline":
+        write(i)
+    else:
+        await run_db(write, i)
+
+
+async def heartbeat(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append((time.perf_counter() - t - 0.001) * 1000)
+
+
+async def level(mode: str, concurrency: int) -> dict:
+    lags, stop = [], asyncio.Event()
+    hb  = asyncio.create_task(heartbeat(lags, stop))
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with sem:
+            await request(mode, i)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(N)])
+    elapsed = time.perf_counter() - t0
+    stop.set(); await hb
+    lags.sort()
+    return {
+        "rps":        N / elapsed,
+        "lag_p50_ms": statistics.median(lags) if lags else 0.0,
+        "lag_max_ms": lags[-1] if lags else 0.0,
+    }
+
+
+async def main():
+    init_db()
+    print(f"{'mode':<8}{'conc':>6}{'req/s':>10}{'loop lag p50':>15}{'loop lag max':>15}")
+    for mode in ("inline", "run_db"):
+        for c in (1, 8, 32, 128):
+            r = await level(mode, c)
+            print(f"{mode:<8}{c:>6}{r['rps']:>10.0f}{r['lag_p50_ms']:>13.2f}ms{r['lag_max_ms']:>13.2f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,267 @@
+import os, sys, json, time, random, signal, socket, asyncio, argparse, tempfile, statistics, subprocess
+import httpx
+
+# ── Load test: the real app against the api-sports stub ───────
+#  cd backend && python bench/load.py [scenario ...] [--save bench/baseline.json]
+#                                      [--baseline bench/baseline.json]
+#  Seeds a temp DB_PATH (BENCH_USERS users, 1 in 50 with a pending request),
+#  starts stub_upstream and main:app as separate uvicorn processes, then runs
+#  each scenario closed-loop for --seconds after --warmup and reports RPS and
+#  p50/p95/p99. --baseline compares against a saved run and exits 1 when RPS
+#  drops or p95 grows by more than --tolerance. Baselines are per machine.
+#    dashboard  polling fixtures?live=all like footballGet (ETag + A-IM)
+#    standings  pro/premium users browsing TOP15_LEAGUE_IDS
+#    login      POST /auth/login surge (bcrypt at BCRYPT_ROUNDS)
+#    admin      paging /admin/users, stats, requests, usage over the seeded users
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP     = tempfile.mkdtemp(prefix="t3n28-bench-")
+
+os.environ.setdefault("DB_PATH", os.path.join(TMP, "bench.db"))
+os.environ.setdefault("ADMIN_EMAIL", "bench-admin@example.com")
+os.environ.setdefault("PREFETCH_ENABLED", "0")
+os.environ.setdefault("UPSTREAM_PER_MINUTE", "100000")   # measure the app, not the api-sports quota
+os.environ.setdefault("UPSTREAM_PER_DAY", "10000000")
+sys.path.insert(0, BACKEND)
+
+from database import get_db, init_db
+from auth import hash_password, create_token, ADMIN_EMAIL, TOP15_LEAGUE_IDS
+import stats
+
+BENCH_USERS    = int(os.environ.get("BENCH_USERS", 100000))
+BENCH_PASSWORD = "bench-password"
+TIER_MIX       = ["free"] * 6 + ["starter"] * 2 + ["pro", "premium"]
+
+
+# ── Setup ──
+def seed(n: int) -> list:
+    init_db()
+    pw = hash_password(BENCH_PASSWORD)   # one hash for everyone; login still verifies it in full
+    db = get_db()
+    db.execute("INSERT INTO users (email,name,password_hash,tier) VALUES (?,?,?,?)",
+               (ADMIN_EMAIL, "Bench Admin", pw, "premium"))
+    db.executemany("INSERT INTO users (email,name,password_hash,tier) VALUES (?,?,?,?)",
+                   ((f"user{i}@bench.example.com", f"User {i}", pw, TIER_MIX[i % len(TIER_MIX)]) for i in range(n)))
+    db.execute("""INSERT INTO sub_requests (user_id,email,name,requested_tier)
+                  SELECT id,email,name,'pro' FROM users WHERE id % 50 = 0""")
+    db.commit()
+    stats.reconcile(db)
+    users = [dict(r) for r in db.execute("SELECT id,email,tier FROM users ORDER BY id")]
+    db.close()
+    for u in users:
+        u["auth"] = "Bearer " + create_token(u["id"], u["email"], u["tier"])
+    return users
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def spawn(app: str, port: int, env: dict, workers: int = 1) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", app, "--port", str(port),
+                             "--workers", str(workers), "--log-level", "warning"],
+                            cwd=BACKEND, env={**os.environ, **env}, start_new_session=True)
+
+# the whole group: the app's bcrypt pool workers go with it
+def stop(proc: subprocess.Popen):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(10)
+    except ProcessLookupError:
+        pass
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+
+def wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"{url} exited with {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    sys.exit(f"{url} not ready after {timeout}s")
+
+
+# ── Scenarios: one request per call, per-worker state in w ──
+async def dashboard(c, w):
+    h = {"Authorization": w["user"]["auth"]}
+    if w.get("etag"):
+        h.update({"If-None-Match": w["etag"], "A-IM": "fixture-patch"})
+    r = await c.get("/football/fixtures", params={"live": "all"}, headers=h)
+    if r.status_code in (200, 226):
+        w["etag"] = r.headers.get("etag")
+    return r
+
+async def standings(c, w):
+    return await c.get("/football/standings", params={"league": random.choice(TOP15_LEAGUE_IDS), "season": 2025},
+                       headers={"Authorization": w["user"]["auth"]})
+
+async def login(c, w):
+    return await c.post("/auth/login", json={"email": w["user"]["email"], "password": BENCH_PASSWORD})
+
+async def admin(c, w):
+    h    = {"Authorization": w["admin"]["auth"]}
+    step = w["step"] = w.get("step", -1) + 1
+    if step % 10 == 9:
+        return await c.get(random.choice(["/admin/stats", "/admin/requests", "/admin/usage/users"]), headers=h)
+    params = {"limit": 50, **({"after_id": w["after"]} if w.get("after") else {})}
+    if step % 10 == 8:
+        params["tier"] = random.choice(TIER_MIX)
+    r = await c.get("/admin/users", params=params, headers=h)
+    if r.status_code == 200 and "tier" not in params:
+        w["after"] = r.json()["next_after_id"]
+    return r
+
+# name -> (step, who drives it, default concurrency)
+SCENARIOS = {
+    "dashboard": (dashboard, lambda u: u["email"] != ADMIN_EMAIL, 32),
+    "standings": (standings, lambda u: u["tier"] in ("pro", "premium"), 32),
+    "login":     (login,     lambda u: u["email"] != ADMIN_EMAIL, 16),
+    "admin":     (admin,     lambda u: u["email"] == ADMIN_EMAIL, 4),
+}
+
+
+def pct(sorted_ms: list, p: int) -> float:
+    if len(sorted_ms) < 2:
+        return sorted_ms[0] if sorted_ms else 0.0
+    return statistics.quantiles(sorted_ms, n=100, method="inclusive")[p - 1]
+
+async def drive(base: str, name: str, users: list, concurrency: int, seconds: float, warmup: float) -> dict:
+    step, who, _ = SCENARIOS[name]
+    pool  = [u for u in users if who(u)]
+    adm   = next(u for u in users if u["email"] == ADMIN_EMAIL)
+    lat, statuses = [], {}
+    start = time.perf_counter()
+    measure_from, end = start + warmup, start + warmup + seconds
+
+    async def worker(c):
+        w = {"user": pool[random.randrange(len(pool))], "admin": adm}
+        while (t0 := time.perf_counter()) < end:
+            try:
+                status = (await step(c, w)).status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            if t0 >= measure_from:
+                lat.append((time.perf_counter() - t0) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+            if name == "login":   # a surge is many different users
+                w["user"] = pool[random.randrange(len(pool))]
+
+    # one single-connection client per worker: a shared httpx pool gets slower
+    # with every connection it holds and would cap the numbers before the app does
+    clients = [httpx.AsyncClient(base_url=base, limits=httpx.Limits(max_connections=1), timeout=60)
+               for _ in range(concurrency)]
+    try:
+        await asyncio.gather(*[worker(c) for c in clients])
+    finally:
+        for c in clients:
+            await c.aclose()
+    lat.sort()
+    errors = sum(n for s, n in statuses.items() if not isinstance(s, int) or s >= 400)
+    return {"concurrency": concurrency, "requests": len(lat), "rps": round(len(lat) / seconds, 1),
+            "p50_ms": round(pct(lat, 50), 2), "p95_ms": round(pct(lat, 95), 2), "p99_ms": round(pct(lat, 99), 2),
+            "errors": errors, "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)}}
+
+
+# mean ms per request stage, from the app's /metrics (this run's share only)
+def stage_totals(app_url: str) -> dict:
+    out = {}
+    for line in httpx.get(app_url + "/metrics").text.splitlines():
+        if line.startswith("t3n28_request_stage_seconds_sum") or line.startswith("t3n28_request_stage_seconds_count"):
+            key, value = line.rsplit(" ", 1)
+            stage = key.split('stage="', 1)[1].split('"', 1)[0]
+            out.setdefault(stage, [0.0, 0])[key.startswith("t3n28_request_stage_seconds_count")] = float(value)
+    return out
+
+def stage_means(before: dict, after: dict) -> str:
+    parts = []
+    for stage, (total, n) in after.items():
+        t0, n0 = before.get(stage, (0.0, 0))
+        if n > n0:
+            parts.append(f"{stage} {(total - t0) / (n - n0) * 1000:.2f}")
+    return "  ".join(parts)
+
+
+# ── Baseline ──
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    ok = True
+    print(f"\n{'vs baseline':<12}{'rps':>18}{'p95 ms':>22}{'p99 ms':>22}")
+    for name, r in results.items():
+        b = baseline.get("results", {}).get(name)
+        if not b:
+            print(f"{name:<12}  (not in baseline)")
+            continue
+        bad = r["rps"] < b["rps"] * (1 - tolerance) or r["p95_ms"] > b["p95_ms"] * (1 + tolerance)
+        ok &= not bad
+        cell = lambda k: f"{b[k]:>8} → {r[k]:<8}{(r[k] / b[k] - 1) * 100 if b[k] else 0:+4.0f}%"
+        print(f"{name:<12}{cell('rps'):>18}{cell('p95_ms'):>22}{cell('p99_ms'):>22}  {'REGRESSED' if bad else 'ok'}")
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description="t3n28 load test")
+    ap.add_argument("scenarios", nargs="*", help=" | ".join(SCENARIOS) + " (default: all)")
+    ap.add_argument("--seconds",     type=float, default=15)
+    ap.add_argument("--warmup",      type=float, default=3)
+    ap.add_argument("--concurrency", type=int,   help="override every scenario's default")
+    ap.add_argument("--users",       type=int,   default=BENCH_USERS)
+    ap.add_argument("--workers",     type=int,   default=1, help="uvicorn workers for the app")
+    ap.add_argument("--latency-ms",  type=float, default=150, help="stub upstream latency")
+    ap.add_argument("--fixtures",    type=int,   default=120, help="fixtures per stub payload")
+    ap.add_argument("--events",      type=int,   default=0,   help="events per stub fixture")
+    ap.add_argument("--save",        help="write results to this JSON file")
+    ap.add_argument("--baseline",    help="compare with a JSON file written by --save")
+    ap.add_argument("--tolerance",   type=float, default=0.15)
+    args = ap.parse_args()
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    if set(args.scenarios) - set(SCENARIOS):
+        ap.error(f"unknown scenario: {', '.join(sorted(set(args.scenarios) - set(SCENARIOS)))}")
+
+    t = time.perf_counter()
+    users = seed(args.users)
+    print(f"seeded {len(users)} users into {os.environ['DB_PATH']} in {time.perf_counter() - t:.1f}s")
+
+    stub_port, app_port = free_port(), free_port()
+    stub_url, app_url   = f"http://127.0.0.1:{stub_port}", f"http://127.0.0.1:{app_port}"
+    procs = [spawn("bench.stub_upstream:app", stub_port, {"STUB_LATENCY_MS": str(args.latency_ms),
+                                                           "STUB_FIXTURES": str(args.fixtures),
+                                                           "STUB_EVENTS": str(args.events)}),
+             spawn("main:app", app_port, {"FOOTBALL_API_BASE": stub_url}, args.workers)]
+    try:
+        wait_ready(stub_url + "/_calls", procs[0])
+        wait_ready(app_url + "/", procs[1])
+        results = {}
+        print(f"\n{'scenario':<12}{'conc':>6}{'req':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+              f"{'errors':>8}{'upstream':>10}")
+        for name in args.scenarios:
+            calls  = httpx.get(stub_url + "/_calls").json()["total"]
+            stages = stage_totals(app_url)
+            conc   = args.concurrency or SCENARIOS[name][2]
+            r = results[name] = asyncio.run(drive(app_url, name, users, conc, args.seconds, args.warmup))
+            r["upstream_calls"] = httpx.get(stub_url + "/_calls").json()["total"] - calls - 1
+            print(f"{name:<12}{conc:>6}{r['requests']:>8}{r['rps']:>9}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+                  f"{r['p99_ms']:>10}{r['errors']:>8}{r['upstream_calls']:>10}")
+            print(f"{'':<12}stage ms: {stage_means(stages, stage_totals(app_url))}")
+    finally:
+        for p in procs:
+            stop(p)
+
+    run = {"config": {k: v for k, v in vars(args).items() if k not in ("save", "baseline", "scenarios")},
+           "results": results}
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"\nsaved {args.save}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            if not compare(results, json.load(f), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
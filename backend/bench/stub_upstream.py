@@ -0,0 +1,68 @@
+import os, random, asyncio
+from fastapi import FastAPI, Request
+
+from auth import TOP15_LEAGUE_IDS
+
+# ── Offline stand-in for v3.football.api-sports.io ─────────────
+#  cd backend && uvicorn bench.stub_upstream:app --port 9000
+#  FOOTBALL_API_BASE=http://127.0.0.1:9000 uvicorn main:app
+
+STUB_LATENCY_MS = float(os.environ.get("STUB_LATENCY_MS", 150))
+STUB_JITTER_MS  = float(os.environ.get("STUB_JITTER_MS", 50))
+STUB_FIXTURES   = int(os.environ.get("STUB_FIXTURES", 120))
+STUB_EVENTS     = int(os.environ.get("STUB_EVENTS", 0))       # events per fixture, to grow payloads
+
+app   = FastAPI(title="api-sports stub")
+calls = {"total": 0}
+LEAGUES = TOP15_LEAGUE_IDS + list(range(200, 240))
+
+
+def _fixture(i: int, live: bool) -> dict:
+    lid = LEAGUES[i % len(LEAGUES)]
+    return {
+        "fixture": {"id": 1000 + i, "date": "2026-01-01T15:00:00+00:00",
+                    "status": {"short": "2H" if live else "NS", "elapsed": random.randint(1, 90) if live else None}},
+        "league":  {"id": lid, "name": f"League {lid}", "country": "Stubland", "season": 2025},
+        "teams":   {"home": {"id": 2 * i, "name": f"Home {i}"}, "away": {"id": 2 * i + 1, "name": f"Away {i}"}},
+        "goals":   {"home": random.randint(0, 3) if live else None, "away": random.randint(0, 3) if live else None},
+        "events":  [{"time": {"elapsed": e * 5}, "team": {"id": 2 * i}, "player": {"id": e, "name": f"Player {e}"},
+                     "type": "Goal" if e % 4 == 0 else "Card", "detail": "Normal Goal" if e % 4 == 0 else "Yellow Card"}
+                    for e in range(STUB_EVENTS)],
+    }
+
+
+def _envelope(endpoint: str, params: dict, response: list) -> dict:
+    return {"get": endpoint, "parameters": params, "errors": [], "results": len(response),
+            "paging": {"current": 1, "total": 1}, "response": response}
+
+
+@app.middleware("http")
+async def latency(request: Request, call_next):
+    calls["total"] += 1
+    await asyncio.sleep(max(0.0, STUB_LATENCY_MS + random.uniform(-STUB_JITTER_MS, STUB_JITTER_MS)) / 1000)
+    return await call_next(request)
+
+
+@app.get("/fixtures")
+def fixtures(request: Request):
+    params = dict(request.query_params)
+    live   = "live" in params
+    return _envelope("fixtures", params, [_fixture(i, live) for i in range(STUB_FIXTURES)])
+
+
+@app.get("/standings")
+def standings(request: Request, league: int = 39, season: int = 2025):
+    table = [{"rank": r, "team": {"id": r, "name": f"Team {r}"}, "points": 60 - r * 2, "goalsDiff": 20 - r * 2,
+              "all": {"played": 20, "win": 18 - r, "draw": 2, "lose": r}} for r in range(1, 21)]
+    return _envelope("standings", dict(request.query_params),
+                     [{"league": {"id": league, "name": f"League {league}", "season": season, "standings": [table]}}])
+
+
+@app.get("/_calls")
+def call_count():
+    return calls
+
+
+@app.get("/{path:path}")
+def anything(path: str, request: Request):
+    return _envelope(path, dict(request.query_params), [])
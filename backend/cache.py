@@ -0,0 +1,389 @@
+import os, json, time, zlib, asyncio, hashlib, threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from database import run_db
+import diff, store as backends
+
+try:
+    import zstandard  # optional, pip install zstandard
+except ImportError:
+    zstandard = None
+
+# ── Two-tier response cache ────────────────────────────────────
+#  tier 1: in-process LRU bounded by bytes. Entries hold raw JSON only (the
+#          parsed form is rebuilt on demand); whatever gets attached later
+#          (gzip head, patch, shape index and views) is charged to the entry
+#          through grew()
+#  tier 2: shared store (store.py: api_cache table or redis), survives restarts
+#          and refills tier 1 on miss; bodies are stored compressed and a
+#          janitor keeps it under budget
+
+MEM_CACHE_BYTES   = int(os.environ.get("MEM_CACHE_BYTES", 32 * 1024 * 1024))
+MEM_CACHE_MAX_AGE = int(os.environ.get("MEM_CACHE_MAX_AGE", 86400))
+
+# stale-while-revalidate: serve an expired entry at once (up to SWR_MAX_STALE
+# past its TTL) and refresh it in the background; stale-if-error: fall back to
+# anything younger than STALE_IF_ERROR when api-sports fails
+CACHE_SWR         = os.environ.get("CACHE_SWR", "1") == "1"
+SWR_MAX_STALE     = int(os.environ.get("SWR_MAX_STALE", 1800))
+STALE_IF_ERROR    = int(os.environ.get("STALE_IF_ERROR", 86400))
+
+# api_cache storage: codec for new rows (zstd | zlib | identity; bodies under
+# CACHE_COMPRESS_MIN bytes stay identity), a byte budget on stored size
+# enforced least-recently-used first, a hard age limit, and how many freed
+# pages each sweep returns to the filesystem
+CACHE_CODEC        = os.environ.get("CACHE_CODEC", "zstd" if zstandard else "zlib")
+CACHE_COMPRESS_MIN = int(os.environ.get("CACHE_COMPRESS_MIN", 256))
+CACHE_DB_BYTES     = int(os.environ.get("CACHE_DB_BYTES", 256 * 1024 * 1024))
+CACHE_DB_MAX_AGE   = int(os.environ.get("CACHE_DB_MAX_AGE", 7 * 86400))
+CACHE_SWEEP_SECS   = float(os.environ.get("CACHE_SWEEP_SECS", 300))
+CACHE_VACUUM_PAGES = int(os.environ.get("CACHE_VACUUM_PAGES", 2000))
+
+# delta encoding: for these endpoints a refreshed entry keeps the version it
+# replaced, and clients holding that version can be sent a diff.py patch
+CACHE_DELTA_ENDPOINTS = set(filter(None, os.environ.get("CACHE_DELTA_ENDPOINTS", "fixtures").split(",")))
+
+if CACHE_CODEC == "zstd" and zstandard is None:
+    print("⚠️  CACHE_CODEC=zstd but zstandard is not installed — using zlib")
+    CACHE_CODEC = "zlib"
+
+
+# canonical "endpoint?a=1&b=2": trimmed path, params sorted, blanks dropped
+def normalize_path(path: str) -> str:
+    return "/".join(p for p in path.strip().split("/") if p)
+
+# the query both the key and the upstream call use — forwarding a blank the key
+# dropped would store api-sports' error for it under the valid request's key
+def query_params(params) -> list:
+    return sorted((k, v) for k, v in params if v != "")
+
+def make_key(path: str, params) -> str:
+    items = query_params(params)
+    return normalize_path(path) + ("?" + urlencode(items) if items else "")
+
+
+def _ts(iso: str) -> float:
+    return datetime.fromisoformat(iso).replace(tzinfo=timezone.utc).timestamp()
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def encode(raw: bytes, codec: str = CACHE_CODEC):
+    if len(raw) < CACHE_COMPRESS_MIN or codec == "identity":
+        return "identity", raw
+    if codec == "zstd":
+        return codec, zstandard.ZstdCompressor(level=3).compress(raw)
+    return "zlib", zlib.compress(raw, 6)
+
+def decode(codec: str, blob) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(blob)
+    if codec == "zstd":
+        if zstandard is None:
+            raise LookupError("zstd row but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return blob.encode() if isinstance(blob, str) else bytes(blob)   # identity: pre-v4 rows are TEXT
+
+
+class CacheEntry:
+    __slots__ = ("key", "endpoint", "raw", "fetched_at", "_etag", "charged",
+                 "gz", "prev", "patch", "index", "views", "owner")
+
+    def __init__(self, key, endpoint, raw: bytes, fetched_at: float):
+        self.key        = key
+        self.endpoint   = endpoint
+        self.raw        = raw
+        self.fetched_at = fetched_at
+        self._etag      = None
+        self.charged    = 0      # bytes MemoryCache has counted for it
+        self.gz         = None   # pre-compressed envelope head, see envelope.py
+        self.prev       = None   # Version this one replaced (delta endpoints only)
+        self.patch      = None   # encoded prev → self patch, b"" when not diffable
+        self.index      = None   # per-league item index, see shape.py
+        self.views      = None   # shaped variants of this payload, by shape spec
+        self.owner      = None   # for a shaped variant: the entry it was cut from
+
+    # parsed anew each time: a parsed payload is several times the size of its
+    # JSON, and every user of it (patches, shape index, live feeds) needs it once
+    @property
+    def data(self):
+        return json.loads(self.raw)
+
+    # weak: the payload version, not the per-request envelope around it
+    @property
+    def etag(self) -> str:
+        if self._etag is None:
+            self._etag = 'W/"%s"' % hashlib.blake2b(self.raw, digest_size=12).hexdigest()
+        return self._etag
+
+    @property
+    def size(self) -> int:
+        n = len(self.raw) + (len(self.gz[0]) if self.gz else 0) + len(self.patch or b"")
+        if self.prev is not None and self.owner is None:   # a variant's prev is in its owner's
+            n += self.prev.size
+        if self.index:
+            n += self.index.size
+        if self.views:
+            n += sum(v.size for v in list(self.views.values()))
+        return n
+
+    # call after attaching something, so the memory tier's byte count stays true
+    def grew(self):
+        memory.resize(self.owner or self)
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+# what a refreshed entry keeps of the one it replaced — enough to diff against,
+# plus the same for each shaped view of it (shape.py), and nothing that links on
+class Version:
+    __slots__ = ("etag", "raw", "views")
+
+    def __init__(self, etag: str, raw: bytes, views=None):
+        self.etag  = etag
+        self.raw   = raw
+        self.views = views
+
+    @property
+    def data(self):
+        return json.loads(self.raw)
+
+    @property
+    def size(self) -> int:
+        return len(self.raw) + sum(len(v.raw) for v in (self.views or {}).values())
+
+
+class MemoryCache:
+    def __init__(self, max_bytes: int, max_age: int):
+        self.max_bytes = max_bytes
+        self.max_age   = max_age
+        self.bytes     = 0
+        self.hits = self.misses = self.evictions = self.expired = 0
+        self._items = OrderedDict()
+        self._lock  = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            e = self._items.get(key)
+            if e is None:
+                self.misses += 1
+                return None
+            if e.age() > self.max_age:
+                self._drop(key)
+                self.expired += 1
+                self.misses  += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return e
+
+    def put(self, e: CacheEntry):
+        if e.size > self.max_bytes:
+            return
+        with self._lock:
+            if e.key in self._items:
+                self._drop(e.key)
+            self._items[e.key] = e
+            e.charged   = e.size
+            self.bytes += e.charged
+            self._evict()
+
+    # e grew since it was put; may evict e itself when it no longer fits
+    def resize(self, e: CacheEntry):
+        with self._lock:
+            if self._items.get(e.key) is not e:
+                return
+            size        = e.size
+            self.bytes += size - e.charged
+            e.charged   = size
+            self._evict()
+
+    def _evict(self):
+        while self.bytes > self.max_bytes:
+            self._drop(next(iter(self._items)))
+            self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+
+    def peek(self, key):
+        with self._lock:
+            return self._items.get(key)
+
+    def delete_prefix(self, prefix: str) -> int:
+        with self._lock:
+            keys = [k for k in self._items if k.startswith(prefix)]
+            for k in keys:
+                self._drop(k)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def _drop(self, key):
+        self.bytes -= self._items.pop(key).charged
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries":   len(self._items),
+            "bytes":     self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits":      self.hits,
+            "misses":    self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expired":   self.expired,
+        }
+
+
+memory = MemoryCache(MEM_CACHE_BYTES, MEM_CACHE_MAX_AGE)
+db_reads = 0
+_touched = {}   # key -> last read, written to accessed_at in batches by the janitor
+
+
+# memory first, api_cache refills it; a memory hit returns inline, only the
+# store read is offloaded
+async def lookup_async(key: str):
+    return _hit(memory.get(key)) or await run_db(_lookup_db, key)
+
+def _hit(e):
+    if e is not None:
+        _touched[e.key] = time.time()
+    return e
+
+def _lookup_db(key: str):
+    global db_reads
+    row = backends.get().cache_get(key)
+    db_reads += 1
+    if not row:
+        return None
+    try:
+        raw = decode(row["codec"], row["response"])
+    except Exception as e:   # unreadable row: treat as a miss, the refresh overwrites it
+        print(f"⚠️  api_cache {key}: {e!r}")
+        return None
+    e = CacheEntry(key, row["endpoint"], raw, _ts(row["fetched_at"]))
+    memory.put(e)
+    return _hit(e)
+
+
+def store(key: str, endpoint: str, raw: bytes, uid=None, tier=None) -> CacheEntry:
+    now         = datetime.utcnow()
+    codec, blob = encode(raw)
+    backends.get().cache_put(key, endpoint, blob, codec, now.isoformat(), uid, tier, ttl=CACHE_DB_MAX_AGE)
+    e = CacheEntry(key, endpoint, raw, now.replace(tzinfo=timezone.utc).timestamp())
+    if endpoint.strip("/") in CACHE_DELTA_ENDPOINTS:
+        old = memory.peek(key)
+        if old is not None and old.etag != e.etag:
+            e.prev = Version(old.etag, old.raw,
+                             {spec: Version(v.etag, v.raw) for spec, v in list(old.views.items())}
+                             if old.views else None)
+    memory.put(e)
+    return e
+
+
+# the encoded patch from version `etag` to `entry`, or None when the client must
+# take the full payload (unknown version, or payloads diff.py can't match up)
+def patch_from(entry, etag: str):
+    prev = entry.prev
+    if prev is None or prev.etag.removeprefix("W/") != etag.strip().removeprefix("W/"):
+        return None
+    if entry.patch is None:
+        entry.patch = _encode_patch(prev, entry)
+        entry.grew()
+    return entry.patch or None
+
+def _encode_patch(prev, entry) -> bytes:
+    old, new = prev.data, entry.data
+    if not (isinstance(old, dict) and isinstance(new, dict)):
+        return b""
+    rest = lambda d: {k: v for k, v in d.items() if k not in ("response", "results", "shape")}
+    ops  = diff.diff(old.get("response"), new.get("response")) if rest(old) == rest(new) else None
+    if ops is None:
+        return b""
+    return json.dumps({"from": prev.etag, "to": entry.etag, "ops": ops}, separators=(",", ":")).encode()
+
+
+# drop every key starting with `prefix` ("fixtures", "standings?league=39") from both tiers
+def invalidate(prefix: str) -> int:
+    prefix = prefix.lstrip("/")
+    memory.delete_prefix(prefix)
+    for k in [k for k in list(_touched) if k.startswith(prefix)]:
+        _touched.pop(k, None)
+    return backends.get().cache_delete_prefix(prefix)
+
+def clear():
+    memory.clear()
+    _touched.clear()
+    backends.get().cache_clear()
+
+
+class Janitor:
+    def __init__(self, max_bytes=CACHE_DB_BYTES, max_age=CACHE_DB_MAX_AGE, vacuum_pages=CACHE_VACUUM_PAGES):
+        self.max_bytes    = max_bytes
+        self.max_age      = max_age
+        self.vacuum_pages = vacuum_pages
+        self.sweeps = self.expired = self.evicted = self.vacuumed = 0
+        self.rows = self.bytes = 0
+        self._task = None
+
+    def sweep(self):
+        global _touched
+        touched, _touched = _touched, {}
+        r = backends.get().cache_sweep({k: _iso(ts) for k, ts in touched.items()},
+                                       self.max_bytes, self.max_age, self.vacuum_pages)
+        self.expired  += r["expired"]
+        self.evicted  += r["evicted"]
+        self.vacuumed += r["vacuumed"]
+        self.rows, self.bytes = r["rows"], r["bytes"]
+        self.sweeps   += 1
+
+    async def run(self, interval: float = CACHE_SWEEP_SECS):
+        while True:
+            try:
+                await run_db(self.sweep)
+            except Exception as e:   # keep the loop alive; next sweep retries
+                print(f"⚠️  cache sweep failed: {e!r}")
+            await asyncio.sleep(interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "backend":        backends.get().name,
+            "codec":          CACHE_CODEC,
+            "rows":           self.rows,
+            "bytes":          self.bytes,
+            "max_bytes":      self.max_bytes,
+            "sweeps":         self.sweeps,
+            "expired":        self.expired,
+            "evicted":        self.evicted,
+            "vacuumed_pages": self.vacuumed,
+        }
+
+
+janitor = Janitor()
+
+
+def stats() -> dict:
+    return {"memory": memory.stats(), "db_reads": db_reads, "db": janitor.stats()}
@@ -1,14 +1,112 @@
-import sqlite3, os
-from datetime import datetime
+import sqlite3, os, sys, time, threading, asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
 
 DB_PATH = os.environ.get("DB_PATH", "t3n28.db")
 
+DB_POOL_SIZE    = int(os.environ.get("DB_POOL_SIZE", 8))
+DB_SYNCHRONOUS  = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE   = int(os.environ.get("DB_CACHE_SIZE", -16000))      # negative = KiB
+DB_MMAP_SIZE    = int(os.environ.get("DB_MMAP_SIZE", 128 * 1024 * 1024))
+DB_BUSY_TIMEOUT = int(os.environ.get("DB_BUSY_TIMEOUT", 5000))       # ms
+DB_THREADS      = int(os.environ.get("DB_THREADS", 4))
+
+# ── Connection pool ────────────────────────────────────────────
+#  get_db() hands out a pooled connection; close() returns it to the pool
+#  (rolling back anything uncommitted) so call sites stay unchanged.
+
+class PooledConnection(sqlite3.Connection):
+    def close(self):
+        _pool.release(self)
+
+class ConnectionPool:
+    def __init__(self, size: int):
+        self.size    = size
+        self.created = 0
+        self.reused  = 0
+        self._idle   = []
+        self._lock   = threading.Lock()
+
+    def acquire(self) -> PooledConnection:
+        with self._lock:
+            if self._idle:
+                conn = self._idle.pop()
+                conn.pooled_idle = False
+                self.reused += 1
+                return conn
+        return self._connect()
+
+    def release(self, conn):
+        if getattr(conn, "pooled_idle", False):
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.size:
+                conn.pooled_idle = True
+                self._idle.append(conn)
+                return
+        sqlite3.Connection.close(conn)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            sqlite3.Connection.close(conn)
+
+    def _connect(self) -> PooledConnection:
+        conn = sqlite3.connect(DB_PATH, factory=PooledConnection, check_same_thread=False,
+                               timeout=DB_BUSY_TIMEOUT / 1000)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size={DB_CACHE_SIZE}")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT}")
+        conn.pooled_idle = False
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def stats(self) -> dict:
+        return {"size": self.size, "idle": len(self._idle),
+                "created": self.created, "reused": self.reused}
+
+_pool = ConnectionPool(DB_POOL_SIZE)
+
 def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute("PRAGMA foreign_keys=ON")
-    return conn
+    return _pool.acquire()
+
+def pool_stats() -> dict:
+    return _pool.stats()
+
+# ── Async path: async handlers hand blocking sqlite work to a dedicated
+#  executor so a slow commit never stalls the event loop
+_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+
+async def run_db(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+# Take the write lock up front so the wait for it (busy_timeout) is measurable
+# on its own instead of hiding inside the first INSERT
+def begin_write(db, op: str):
+    if db.in_transaction:
+        return
+    t0 = time.perf_counter()
+    try:
+        db.execute("BEGIN IMMEDIATE")
+    finally:
+        metrics.LOCK_WAIT.labels(op).observe(time.perf_counter() - t0)
+
+# FastAPI dependency: one pooled connection per request, released afterwards
+def db_session():
+    db = get_db()
+    try:
+        yield db
+    finally:
+        db.close()
 
 def init_db():
     db = get_db()
@@ -88,11 +186,155 @@ def init_db():
     )""")
 
     db.commit()
+    migrate(db)
     db.close()
     print("✅ DB ready")
 
+# ── Schema migrations ──────────────────────────────────────────
+#  MIGRATIONS[n] takes the schema from user_version n to n+1. Append only.
+#  Each step runs with its user_version bump in one BEGIN IMMEDIATE
+#  transaction that re-reads the version first, so workers starting together
+#  on a new file apply every step exactly once, and a crash mid-step rolls it
+#  back whole. VACUUM can't run in a transaction; it follows the commit.
+
+# rebuilds `stats` and stats_daily.new_users from scratch (also: python stats.py reconcile)
+RECONCILE_STATS = [
+    "DELETE FROM stats",
+    "INSERT INTO stats (key,value) SELECT 'users', COUNT(*) FROM users",
+    "INSERT INTO stats (key,value) SELECT 'tier:' || tier, COUNT(*) FROM users GROUP BY tier",
+    "INSERT INTO stats (key,value) SELECT 'disabled', COUNT(*) FROM users WHERE status='disabled'",
+    "INSERT INTO stats (key,value) SELECT 'pending_reqs', COUNT(*) FROM sub_requests WHERE status='pending'",
+    "INSERT INTO stats (key,value) SELECT 'unread_notifs', COUNT(*) FROM notifications WHERE read=0",
+    """INSERT INTO stats_daily (date,new_users)
+       SELECT substr(created_at,1,10), COUNT(*) FROM users WHERE true GROUP BY 1
+       ON CONFLICT(date) DO UPDATE SET new_users=excluded.new_users""",
+]
+
+# a step for MIGRATIONS: ALTER TABLE … ADD COLUMN has no IF NOT EXISTS, so a
+# database that already has the column (added by hand, or by a runner that
+# died before the version bump) would otherwise never start again
+def add_column(table: str, column: str, decl: str):
+    def step(db):
+        if column not in [r[1] for r in db.execute(f"PRAGMA table_info({table})")]:
+            db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    return step
+
+MIGRATIONS = [
+    # 1: indexes for admin + notification read paths
+    [
+        "CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_users_tier ON users(tier)",
+        "CREATE INDEX IF NOT EXISTS idx_sub_requests_status ON sub_requests(status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_sub_requests_user ON sub_requests(user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_notifications_unread ON notifications(read) WHERE read=0",
+        "CREATE INDEX IF NOT EXISTS idx_api_usage_date ON api_usage(date, count)",
+        "CREATE INDEX IF NOT EXISTS idx_tier_changes_user ON tier_changes(user_id, changed_at)",
+    ],
+    # 2: materialised admin stats (see stats.py), seeded from the live tables
+    [
+        """CREATE TABLE IF NOT EXISTS stats (
+            key    TEXT PRIMARY KEY,
+            value  INTEGER NOT NULL DEFAULT 0
+        )""",
+        """CREATE TABLE IF NOT EXISTS stats_daily (
+            date         TEXT PRIMARY KEY,
+            total_users  INTEGER NOT NULL DEFAULT 0,
+            new_users    INTEGER NOT NULL DEFAULT 0,
+            pending_reqs INTEGER NOT NULL DEFAULT 0,
+            disabled     INTEGER NOT NULL DEFAULT 0,
+            mrr          INTEGER NOT NULL DEFAULT 0,
+            tiers        TEXT,
+            updated_at   TEXT
+        )""",
+        *RECONCILE_STATS,
+    ],
+    # 3: keyset paging walks sub_requests by (status, id); status alone carries the rowid
+    [
+        "DROP INDEX IF EXISTS idx_sub_requests_status",
+        "CREATE INDEX IF NOT EXISTS idx_sub_requests_status ON sub_requests(status)",
+    ],
+    # 4: compressed api_cache rows with a per-row codec, stored size and LRU stamp (see cache.py)
+    [
+        add_column("api_cache", "codec", "TEXT NOT NULL DEFAULT 'identity'"),
+        add_column("api_cache", "size", "INTEGER NOT NULL DEFAULT 0"),
+        add_column("api_cache", "accessed_at", "TEXT"),
+        "UPDATE api_cache SET size=length(CAST(response AS BLOB)), accessed_at=fetched_at",
+        "CREATE INDEX IF NOT EXISTS idx_api_cache_accessed ON api_cache(accessed_at)",
+    ],
+    # 5: let the cache janitor hand freed pages back with incremental_vacuum.
+    #    auto_vacuum only takes effect after a full VACUUM (one-off, outside a transaction)
+    [
+        "PRAGMA auto_vacuum=INCREMENTAL",
+        "VACUUM",
+    ],
+    # 6: shared counters between workers (users_version: see auth.sync_users)
+    [
+        """CREATE TABLE IF NOT EXISTS counters (
+            name   TEXT PRIMARY KEY,
+            value  INTEGER NOT NULL DEFAULT 0
+        )""",
+    ],
+]
+
+
+def migrate(db):
+    while True:
+        begin_write(db, "migrate")
+        try:
+            version = db.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(MIGRATIONS):
+                db.commit()
+                return
+            steps = MIGRATIONS[version]
+            for sql in steps:
+                if callable(sql):
+                    sql(db)
+                elif sql != "VACUUM":
+                    db.execute(sql)
+            db.execute(f"PRAGMA user_version={version + 1}")
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        if "VACUUM" in steps:
+            db.execute("VACUUM")
+        print(f"✅ DB migrated to v{version + 1}")
+
+# hot/admin queries with sample parameters, for `python database.py explain`
+EXPLAIN_QUERIES = {
+    "admin_stats.tiers":     ("SELECT tier, COUNT(*) as n FROM users GROUP BY tier", ()),
+    "admin_stats.new_today": ("SELECT COUNT(*) as n FROM users WHERE created_at >= ? AND created_at < ?",
+                              ("2025-01-01", "2025-01-02")),
+    "admin_stats.pending":   ("SELECT COUNT(*) as n FROM sub_requests WHERE status='pending'", ()),
+    "admin_stats.unread":    ("SELECT COUNT(*) as n FROM notifications WHERE read=0", ()),
+    "admin_users":           ("SELECT id,email,name,whatsapp,tier,status,created_at,last_login FROM users "
+                              "WHERE tier=? AND id<? ORDER BY id DESC LIMIT 101", ("pro", 1000)),
+    "admin_requests":        ("SELECT * FROM sub_requests WHERE status=? AND id<? ORDER BY id DESC LIMIT 101",
+                              ("pending", 1000)),
+    "admin_usage_users":     ("SELECT * FROM api_usage WHERE date=? ORDER BY count DESC LIMIT 50", ("2025-01-01",)),
+    "get_notifs":            ("SELECT * FROM notifications WHERE user_id=? ORDER BY created_at DESC LIMIT 20", (1,)),
+    "my_sub":                ("SELECT * FROM sub_requests WHERE user_id=? ORDER BY created_at DESC LIMIT 1", (1,)),
+}
+
+def explain(db, out=sys.stdout):
+    for name, (sql, params) in EXPLAIN_QUERIES.items():
+        print(f"── {name}\n   {sql}", file=out)
+        for row in db.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall():
+            print(f"   {row['detail']}", file=out)
+
 def row_to_dict(row):
     return dict(row) if row else None
 
 def rows_to_list(rows):
     return [dict(r) for r in rows]
+
+
+if __name__ == "__main__":
+    # python database.py migrate | explain
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+    init_db()
+    if cmd == "explain":
+        db = get_db()
+        explain(db)
+        db.close()
@@ -0,0 +1,90 @@
+import copy
+
+# ── Structural diffs of api-sports list payloads ───────────────
+#  Items of `response` are matched by fixture.id (or a top-level "id").
+#  Inside an item dicts are walked key by key; lists and scalars are replaced
+#  whole. Ops are JSON Patch shaped, with the item key pulled out of the path:
+#    {"op": "add",     "id": 7}  + "value"                   new item (appended)
+#    {"op": "remove",  "id": 7}                              item gone
+#    {"op": "replace", "id": 7, "path": "/goals/home", "value": 2}
+#    {"op": "add" | "remove", "id": 7, "path": "/score/x"}   key appeared / vanished
+#    {"op": "order", "value": [ids]}                          only when the order changed
+#  apply() is the reference for the client side (applyPatch in api.js).
+
+
+def item_key(item):
+    if not isinstance(item, dict):
+        return None
+    f = item.get("fixture")
+    if isinstance(f, dict) and "id" in f:
+        return f["id"]
+    return item.get("id")
+
+# None when the items can't be matched one-to-one by key
+def keyed(items) -> dict:
+    out = {}
+    for item in items or []:
+        k = item_key(item)
+        if k is None or k in out:
+            return None
+        out[k] = item
+    return out
+
+
+def _pointer(path, key) -> str:
+    return path + "/" + str(key).replace("~", "~0").replace("/", "~1")
+
+def _walk(a: dict, b: dict, id, path, ops):
+    for k in a:
+        if k not in b:
+            ops.append({"op": "remove", "id": id, "path": _pointer(path, k)})
+    for k, v in b.items():
+        p = _pointer(path, k)
+        if k not in a:
+            ops.append({"op": "add", "id": id, "path": p, "value": v})
+        elif isinstance(v, dict) and isinstance(a[k], dict):
+            _walk(a[k], v, id, p, ops)
+        elif a[k] != v:
+            ops.append({"op": "replace", "id": id, "path": p, "value": v})
+
+
+# ops turning old_items into new_items, or None when they aren't diffable
+def diff(old_items, new_items):
+    old, new = keyed(old_items), keyed(new_items)
+    if old is None or new is None:
+        return None
+    ops = [{"op": "remove", "id": k} for k in old if k not in new]
+    for k, item in new.items():
+        if k not in old:
+            ops.append({"op": "add", "id": k, "value": item})
+        elif old[k] != item:
+            _walk(old[k], item, k, "", ops)
+    order = [k for k in old if k in new] + [k for k in new if k not in old]
+    if order != list(new):
+        ops.append({"op": "order", "value": list(new)})
+    return ops
+
+
+def _unpointer(path) -> list:
+    return [p.replace("~1", "/").replace("~0", "~") for p in path.split("/")[1:]]
+
+def apply(items, ops) -> list:
+    by_key = {item_key(i): copy.deepcopy(i) for i in items}
+    for op in ops:
+        if op["op"] == "order":
+            by_key = {k: by_key[k] for k in op["value"]}
+        elif "path" not in op:
+            if op["op"] == "remove":
+                by_key.pop(op["id"], None)
+            else:
+                by_key[op["id"]] = copy.deepcopy(op["value"])
+        else:
+            *parents, last = _unpointer(op["path"])
+            node = by_key[op["id"]]
+            for p in parents:
+                node = node[p]
+            if op["op"] == "remove":
+                node.pop(last, None)
+            else:
+                node[last] = copy.deepcopy(op["value"])
+    return list(by_key.values())
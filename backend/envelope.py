@@ -0,0 +1,90 @@
+import os, json, zlib, struct
+
+# ── /football response envelope ────────────────────────────────
+#  {"data":<cached bytes>,"cache_hit":…,"usage":{…},"warn":…,"over_limit":…}
+#  Everything up to the comma after "data" is the same for every request that
+#  hits one cache entry, so its gzip stream is built once per entry (as a
+#  sync-flushed raw deflate) and kept on it. Per request only the ~150-byte
+#  tail is deflated on its own and appended, followed by a trailer with the
+#  combined CRC — one valid gzip member, no recompression of the payload.
+#  The flag part of the tail is pre-encoded too; only the counters are formatted.
+#  Clients that send `A-IM: fixture-patch` with the ETag of the version they
+#  hold get 226 and {"patch": …} instead of "data" when a patch exists.
+#  POST /football/batch splices several entries into one {"results": […]}.
+
+DELTA_IM = "fixture-patch"
+
+ENVELOPE_GZIP_MIN   = int(os.environ.get("ENVELOPE_GZIP_MIN", 1024))
+ENVELOPE_GZIP_LEVEL = int(os.environ.get("ENVELOPE_GZIP_LEVEL", 6))
+
+OPEN        = b'{"data":'
+_GZ_HEADER  = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+_FLAGS      = {
+    (hit, reason): json.dumps({"cache_hit": hit, "stale": reason is not None, "stale_reason": reason},
+                              separators=(",", ":"))[1:-1].encode()
+    for hit in (True, False) for reason in (None, "revalidating", "upstream_error")
+}
+_BOOL       = {True: b"true", False: b"false"}
+
+
+def _usage(count: int, limit: int) -> bytes:
+    return b'"usage":{"count":%d,"limit":%d,"remaining":%d},"warn":%s,"over_limit":%s' % (
+        count, limit, max(0, limit - count), _BOOL[count >= int(limit * 0.8)], _BOOL[count > limit])
+
+def tail(cache_hit: bool, stale, count: int, limit: int) -> bytes:
+    return b"%s,%s}" % (_FLAGS[(cache_hit, stale)], _usage(count, limit))
+
+
+def body(entry, end: bytes) -> bytes:
+    return b"".join((OPEN, entry.raw, b",", end))
+
+
+# delta reply (226 IM Used): {"patch":{"from","to","ops"},…same tail…}
+def patch_body(patch: bytes, end: bytes) -> bytes:
+    return b"".join((b'{"patch":', patch, b",", end))
+
+
+# batch: one object per requested path, in request order
+#   {"path","status":200,"etag",…flags,"data":<cached bytes>}
+#   {"path","status":304,"etag",…flags}        the client's copy is current
+#   {"path","status":4xx/5xx,"detail"}         this path failed, the rest didn't
+def batch_item(path: str, entry, cache_hit: bool, stale, with_data: bool = True) -> bytes:
+    head = b'{"path":%s,"status":%d,"etag":%s,%s' % (
+        json.dumps(path).encode(), 200 if with_data else 304, json.dumps(entry.etag).encode(),
+        _FLAGS[(cache_hit, stale)])
+    return b"".join((head, b',"data":', entry.raw, b"}")) if with_data else head + b"}"
+
+def batch_error(path: str, status: int, detail) -> bytes:
+    return json.dumps({"path": path, "status": status, "detail": detail}, separators=(",", ":")).encode()
+
+def batch_body(items, count: int, limit: int) -> bytes:
+    return b'{"results":[%s],%s}' % (b",".join(items), _usage(count, limit))
+
+
+def wants_gzip(entry, accept_encoding: str) -> bool:
+    return len(entry.raw) >= ENVELOPE_GZIP_MIN and "gzip" in accept_encoding
+
+# CPU-bound; callers on the event loop run it in a thread the first time per entry
+def prepare_gzip(entry):
+    if entry.gz is None:
+        head = OPEN + entry.raw + b","
+        c    = zlib.compressobj(ENVELOPE_GZIP_LEVEL, zlib.DEFLATED, -15)
+        entry.gz = (c.compress(head) + c.flush(zlib.Z_SYNC_FLUSH), zlib.crc32(head), len(head))
+        entry.grew()
+    return entry.gz
+
+def gzip_body(entry, end: bytes) -> bytes:
+    head, crc, n = prepare_gzip(entry)
+    c = zlib.compressobj(1, zlib.DEFLATED, -9, 1)
+    return b"".join((_GZ_HEADER, head, c.compress(end), c.flush(),
+                     struct.pack("<II", zlib.crc32(end, crc), (n + len(end)) & 0xFFFFFFFF)))
+
+
+# If-None-Match: "*" or a list of (weak or strong) tags, compared weakly
+def not_modified(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    want = etag.removeprefix("W/")
+    return any(t.strip().removeprefix("W/") == want for t in if_none_match.split(","))
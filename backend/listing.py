@@ -0,0 +1,73 @@
+import io, os, csv, json
+
+from database import get_db, rows_to_list
+
+# ── Admin lists: keyset pages and streamed exports ─────────────
+#  Pages are ordered by id DESC (newest first) and continue with
+#  ?after_id=<next_after_id>, so page N costs the same as page 1. Exports
+#  walk one cursor with fetchmany(EXPORT_BATCH) and yield each batch as
+#  NDJSON or CSV text; memory stays flat however many rows there are.
+
+PAGE_DEFAULT = int(os.environ.get("ADMIN_PAGE_DEFAULT", 100))
+PAGE_MAX     = int(os.environ.get("ADMIN_PAGE_MAX", 500))
+EXPORT_BATCH = int(os.environ.get("ADMIN_EXPORT_BATCH", 500))
+
+EXPORT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+USERS    = ("users", "id,email,name,whatsapp,tier,status,created_at,last_login", "tier")
+REQUESTS = ("sub_requests", "*", "requested_tier")
+
+
+# created_from / created_to are ISO dates or datetimes, [from, to)
+def _where(tier_col, tier=None, status=None, created_from=None, created_to=None, after_id=None):
+    clauses, args = [], []
+    for cond, val in ((f"{tier_col}=?", tier), ("status=?", status),
+                      ("created_at>=?", created_from), ("created_at<?", created_to),
+                      ("id<?", after_id)):
+        if val not in (None, ""):
+            clauses.append(cond)
+            args.append(val)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return where, args
+
+
+def query(spec, after_id=None, **filters):
+    table, cols, tier_col = spec
+    where, args = _where(tier_col, after_id=after_id, **filters)
+    return f"SELECT {cols} FROM {table}{where} ORDER BY id DESC", args
+
+
+def page(db, spec, limit=PAGE_DEFAULT, after_id=None, **filters) -> dict:
+    limit     = max(1, min(limit, PAGE_MAX))
+    sql, args = query(spec, after_id, **filters)
+    rows      = rows_to_list(db.execute(sql + " LIMIT ?", (*args, limit + 1)).fetchall())
+    more      = len(rows) > limit
+    items     = rows[:limit]
+    return {"items": items, "next_after_id": items[-1]["id"] if more else None}
+
+
+# generator for StreamingResponse; owns its connection so it outlives the request's db_session
+def export(spec, fmt="ndjson", **filters):
+    sql, args = query(spec, **filters)
+    db = get_db()
+    try:
+        cur  = db.execute(sql, args)
+        cols = [c[0] for c in cur.description]
+        buf  = io.StringIO()
+        out  = csv.writer(buf) if fmt == "csv" else None
+        if out:
+            out.writerow(cols)
+        while True:
+            rows = cur.fetchmany(EXPORT_BATCH)
+            if not rows:
+                break
+            if out:
+                out.writerows(tuple(r) for r in rows)
+            else:
+                buf.writelines(json.dumps(dict(r), ensure_ascii=False) + "\n" for r in rows)
+            yield buf.getvalue()
+            buf.seek(0); buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+    finally:
+        db.close()
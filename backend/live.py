@@ -0,0 +1,177 @@
+import os, json, time, asyncio
+from datetime import datetime
+from fastapi import HTTPException
+
+import cache, upstream, usage, diff, shape
+from auth import CACHE_TTL
+
+# ── Live fixtures push (/live/stream, server-sent events) ──────
+#  One poller reads fixtures?live=all through the shared cache/single-flight
+#  path, so N subscribers cost at most one upstream call per interval. Each
+#  tier has a feed published every CACHE_TTL[tier] seconds: a new subscriber
+#  gets a `snapshot` event, after that only `patch` events (diff.py ops from
+#  the tier's previous version). Each feed carries the tier's shape.py view, so
+#  it only holds the leagues the tier may see. Event bytes are encoded once per
+#  feed and shared by every queue; an idle subscriber is one coroutine + a tiny queue.
+
+LIVE_KEY       = "fixtures?live=all"
+LIVE_TICK      = float(os.environ.get("LIVE_TICK", 5))
+LIVE_HEARTBEAT = float(os.environ.get("LIVE_HEARTBEAT", 15))
+LIVE_QUEUE     = int(os.environ.get("LIVE_QUEUE", 8))         # unsent events before a subscriber is resynced
+LIVE_MAX_SUBS  = int(os.environ.get("LIVE_MAX_SUBS", 10000))  # per worker
+
+_RESYNC = object()
+
+
+def sse(event: str, version: str, data: bytes) -> bytes:
+    return b"event: %s\nid: %s\ndata: %s\n\n" % (event.encode(), version.encode(), data)
+
+def version_of(entry) -> str:
+    return entry.etag[3:-1]   # W/"…" → …
+
+
+class Feed:
+    def __init__(self, tier: str, every: int):
+        self.tier     = tier
+        self.every    = every
+        self.version  = None
+        self.items    = None
+        self.raw      = None
+        self.sent_at  = 0.0
+        self.subs     = set()
+        self._snapshot = None
+
+    def snapshot(self) -> bytes:
+        if self._snapshot is None:
+            raw = self.raw if b"\n" not in self.raw else json.dumps(json.loads(self.raw)).encode()
+            self._snapshot = sse("snapshot", self.version, raw)
+        return self._snapshot
+
+
+class LiveHub:
+    def __init__(self, cadence: dict = CACHE_TTL):
+        self.feeds  = {t: Feed(t, every) for t, every in cadence.items()}
+        self.polls  = self.fetches = self.events = self.resyncs = 0
+        self._task  = None
+
+    def subscriber_count(self) -> int:
+        return sum(len(f.subs) for f in self.feeds.values())
+
+    async def current(self, max_age: float):
+        entry = await cache.lookup_async(LIVE_KEY)
+        if entry and entry.age() < max_age:
+            return entry
+        (entry, fetched), leader = await upstream.flights.do(
+            LIVE_KEY, upstream.refresher(LIVE_KEY, "fixtures", [("live", "all")], max_age, tier="live"))
+        if leader and fetched:
+            self.fetches += 1
+            usage.aggregator.record_background(datetime.utcnow().strftime("%Y-%m-%d"))
+        return entry
+
+    async def tick(self):
+        now = time.time()
+        due = [f for f in self.feeds.values() if f.subs and now - f.sent_at >= f.every]
+        if not due:
+            return
+        self.polls += 1
+        entry = await self.current(min(f.every for f in due))
+        for f in due:
+            self.publish(f, await self.view(f, entry), now)
+
+    async def view(self, feed: Feed, entry):
+        return await shape.view_async(entry, shape.spec_for("fixtures", feed.tier, {}))
+
+    def publish(self, feed: Feed, entry, now: float = None):
+        feed.sent_at = now or time.time()
+        version = version_of(entry)
+        if version == feed.version:
+            return
+        data  = entry.data
+        items = data.get("response") if isinstance(data, dict) else None
+        ops   = diff.diff(feed.items, items) if feed.version else None
+        prev  = feed.version
+        feed.version, feed.items, feed.raw, feed._snapshot = version, items, entry.raw, None
+        if ops is None:
+            event = feed.snapshot()
+        else:
+            event = sse("patch", version, json.dumps({"from": prev, "to": version, "ops": ops},
+                                                     separators=(",", ":")).encode())
+        self.events += 1
+        for q in feed.subs:
+            try:
+                q.put_nowait((version, event))
+            except asyncio.QueueFull:   # too far behind for patches to apply — start it over
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait(_RESYNC)
+                self.resyncs += 1
+
+    async def stream(self, tier: str, last_id: str = None):
+        feed = self.feeds.get(tier) or max(self.feeds.values(), key=lambda f: f.every)
+        q    = asyncio.Queue(LIVE_QUEUE)
+        feed.subs.add(q)
+        self._ensure_running()
+        try:
+            yield b"retry: 5000\n\n"
+            if feed.version is None:
+                try:
+                    entry = await self.current(feed.every)
+                except HTTPException as e:   # the poller keeps trying; the snapshot arrives with its first success
+                    yield b"event: error\ndata: %s\n\n" % json.dumps({"detail": e.detail}).encode()
+                else:
+                    entry = await self.view(feed, entry)
+                    if feed.version is None:
+                        self.publish(feed, entry)
+            sent = last_id
+            if feed.version is not None and sent != feed.version:
+                sent = feed.version
+                yield feed.snapshot()
+            while True:
+                try:
+                    item = await asyncio.wait_for(q.get(), LIVE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if item is _RESYNC:
+                    sent = feed.version
+                    yield feed.snapshot()
+                elif item[0] != sent:   # skip what the opening snapshot already covered
+                    sent = item[0]
+                    yield item[1]
+        finally:
+            feed.subs.discard(q)
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    # exits once nobody is subscribed; the next subscriber starts it again
+    async def run(self, interval: float = LIVE_TICK):
+        while self.subscriber_count():
+            try:
+                await self.tick()
+            except Exception as e:   # keep the loop alive; subscribers keep their last state
+                print(f"⚠️  live poll failed: {e!r}")
+            await asyncio.sleep(interval)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": {t: len(f.subs) for t, f in self.feeds.items()},
+            "versions":    {t: f.version for t, f in self.feeds.items()},
+            "polls":       self.polls,
+            "fetches":     self.fetches,
+            "events":      self.events,
+            "resyncs":     self.resyncs,
+        }
+
+
+hub = LiveHub()
@@ -1,22 +1,27 @@
-import os, json, httpx
+import os, asyncio
+from urllib.parse import urlsplit, parse_qsl
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, List
 
-from fastapi import FastAPI, HTTPException, Depends, Header, Query
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, EmailStr
 
-from database import get_db, init_db, row_to_dict, rows_to_list
+import cache, upstream, prefetch, usage, database, stats, listing, admin_ops, envelope, live, ratelimit, metrics, shape
+import store as usage_store
+from database import get_db, db_session, run_db, init_db, row_to_dict, rows_to_list
 from auth import (
-    hash_password, verify_password, create_token, decode_token,
-    get_user_by_id, get_user_by_email, is_admin,
-    DAILY_LIMITS, CACHE_TTL, TIERS, TOP15_LEAGUE_IDS, can_use_league,
-    ADMIN_EMAIL
+    hash_password_async, verify_password_async, needs_rehash, create_token, decode_token,
+    start_hash_pool, stop_hash_pool, hash_stats,
+    get_user_by_email, cached_user, get_user_cached, invalidate_user, is_admin,
+    users_sync_due, sync_users,
+    DAILY_LIMITS, CACHE_TTL, TIERS, TOP15_LEAGUE_IDS, get_ttl
 )
 
-FOOTBALL_API_KEY  = os.environ.get("FOOTBALL_API_KEY", "9840d945cf9472498c43556397d6386f")
-FOOTBALL_API_BASE = "https://v3.football.api-sports.io"
 OWNER_AFFILIATE   = os.environ.get("OWNER_AFFILIATE", "https://t.me/t3n28football")
+FOOTBALL_BATCH_MAX = int(os.environ.get("FOOTBALL_BATCH_MAX", 20))
 
 app = FastAPI(title="t3n28-football API", version="2.0.0")
 
@@ -26,11 +31,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "IM"],
 )
+# /football/* sets its own Content-Encoding (envelope.py) and passes through untouched
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
+# outermost: times the whole request, compression included
+app.add_middleware(metrics.Middleware)
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     init_db()
+    await upstream.start()
+    usage.aggregator.start()
+    cache.janitor.start()
+    start_hash_pool()
+    if prefetch.PREFETCH_ENABLED:
+        prefetch.prefetcher.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await prefetch.prefetcher.stop()
+    await live.hub.stop()
+    await upstream.close()
+    await usage.aggregator.stop()
+    await cache.janitor.stop()
+    stop_hash_pool()
 
 # ── Pydantic models ────────────────────────────────────────────
 class RegisterIn(BaseModel):
@@ -58,18 +83,41 @@ class TierChangeIn(BaseModel):
     new_tier: str
     note:     Optional[str] = ""
 
+class BulkRequestActionIn(BaseModel):
+    request_ids: List[int]
+    action:      str   # approve | reject
+    note:        Optional[str] = ""
+
+class BulkTierChangeIn(BaseModel):
+    user_ids: List[int]
+    new_tier: str
+    note:     Optional[str] = ""
+
 class UserStatusIn(BaseModel):
     user_id: int
     status:  str  # active | disabled
 
+class FootballBatchIn(BaseModel):
+    paths: List[str]                        # "/fixtures?live=all", same as after /football
+    etags: Optional[dict] = None            # path → ETag held; a match comes back 304 without data
+
 # ── Auth dependency ────────────────────────────────────────────
-def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
+async def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(401, "Missing token")
-    payload = decode_token(authorization.split(" ", 1)[1])
+    return await _authenticate(authorization.split(" ", 1)[1])
+
+async def _authenticate(token: str) -> dict:
+    payload = decode_token(token)
     if not payload:
         raise HTTPException(401, "Token expired or invalid — please log in again")
-    user = get_user_by_id(int(payload["sub"]))
+    uid  = int(payload["sub"])
+    if users_sync_due():
+        await run_db(sync_users)
+    user = cached_user(uid)
+    if user is None:
+        with metrics.span("auth_lookup"):
+            user = await run_db(get_user_cached, uid)
     if not user or user["status"] != "active":
         raise HTTPException(401, "Account not found or disabled")
     return user
@@ -89,45 +137,70 @@ def root():
     return {"status": "ok", "app": "t3n28-football API v2"}
 
 @app.post("/auth/register")
-def register(body: RegisterIn):
-    if get_user_by_email(body.email):
+async def register(body: RegisterIn):
+    if await run_db(get_user_by_email, body.email):
         raise HTTPException(400, "Email already registered")
     if len(body.password) < 6:
         raise HTTPException(400, "Password must be at least 6 characters")
 
+    with metrics.span("password_hash"):
+        pw_hash = await hash_password_async(body.password)
+    uid     = await run_db(_create_user, body, pw_hash)
+    token   = create_token(uid, body.email.lower(), "free")
+    return _auth_response(uid, body.email.lower(), body.name.strip(), "free", token)
+
+def _create_user(body: RegisterIn, pw_hash: str) -> int:
     db  = get_db()
     cur = db.execute(
         "INSERT INTO users (email,name,whatsapp,password_hash,tier) VALUES (?,?,?,?,?)",
-        (body.email.lower(), body.name.strip(), body.whatsapp or "", hash_password(body.password), "free")
+        (body.email.lower(), body.name.strip(), body.whatsapp or "", pw_hash, "free")
     )
-    uid = cur.lastrowid
+    uid    = cur.lastrowid
+    deltas = {"users": 1, "tier:free": 1}
 
     if body.interested_tier and body.interested_tier != "free":
         db.execute(
             "INSERT INTO sub_requests (user_id,email,name,whatsapp,requested_tier) VALUES (?,?,?,?,?)",
             (uid, body.email.lower(), body.name.strip(), body.whatsapp or "", body.interested_tier)
         )
+        deltas["pending_reqs"] = 1
 
+    stats.apply(db, deltas, new_users=1)
     db.commit(); db.close()
-    token = create_token(uid, body.email.lower(), "free")
-    return _auth_response(uid, body.email.lower(), body.name.strip(), "free", token)
+    return uid
 
 
 @app.post("/auth/login")
-def login(body: LoginIn):
-    user = get_user_by_email(body.email.lower())
-    if not user or not verify_password(body.password, user["password_hash"]):
+async def login(body: LoginIn):
+    user = await run_db(get_user_by_email, body.email.lower())
+    with metrics.span("password_hash"):
+        ok = bool(user) and await verify_password_async(body.password, user["password_hash"])
+    if not ok:
         raise HTTPException(401, "Incorrect email or password")
     if user["status"] != "active":
         raise HTTPException(403, "Account disabled — contact admin")
 
-    db = get_db()
-    db.execute("UPDATE users SET last_login=? WHERE id=?", (datetime.utcnow().isoformat(), user["id"]))
-    db.commit(); db.close()
+    # BCRYPT_ROUNDS changed since this hash was made: upgrade it while we hold the password.
+    # Best-effort — a saturated hash pool must not refuse a correct login; the next one retries
+    new_hash = None
+    if needs_rehash(user["password_hash"]):
+        try:
+            new_hash = await hash_password_async(body.password)
+        except HTTPException as e:
+            if e.status_code != 429:
+                raise
+    await run_db(_record_login, user["id"], new_hash)
 
     token = create_token(user["id"], user["email"], user["tier"])
     return _auth_response(user["id"], user["email"], user["name"], user["tier"], token)
 
+def _record_login(uid: int, new_hash: Optional[str]):
+    db = get_db()
+    db.execute("UPDATE users SET last_login=? WHERE id=?", (datetime.utcnow().isoformat(), uid))
+    if new_hash:
+        db.execute("UPDATE users SET password_hash=? WHERE id=?", (new_hash, uid))
+    db.commit(); db.close()
+
 
 @app.get("/auth/me")
 def me(user: dict = Depends(get_current_user)):
@@ -139,6 +212,7 @@ def me(user: dict = Depends(get_current_user)):
         "cache_ttl":     CACHE_TTL.get(tier, 600),
         "owner_affiliate": OWNER_AFFILIATE,
         "top15_ids":     TOP15_LEAGUE_IDS,
+        "seasons":       prefetch.seasons(),
     }
 
 def _user_public(u):
@@ -161,6 +235,7 @@ def _auth_response(uid, email, name, tier, token):
         "daily_limit": DAILY_LIMITS.get(tier, 50),
         "owner_affiliate": OWNER_AFFILIATE,
         "top15_ids":   TOP15_LEAGUE_IDS,
+        "seasons":     prefetch.seasons(),
     }
 
 
@@ -169,89 +244,197 @@ def _auth_response(uid, email, name, tier, token):
 # ══════════════════════════════════════════════════════════════
 
 @app.get("/football/{path:path}")
-async def football_proxy(path: str, user: dict = Depends(get_current_user)):
+async def football_proxy(path: str, request: Request, user: dict = Depends(get_current_user)):
+    # _options (shape.py) stay here; the rest is the upstream query
+    params, opts = shape.split_params(request.query_params.multi_items())
     tier      = user["tier"]
     uid       = user["id"]
     today     = datetime.utcnow().strftime("%Y-%m-%d")
-    ttl       = CACHE_TTL.get(tier, 600)
+    admin     = is_admin(user["email"])
+    endpoint  = cache.normalize_path(path)
+    params    = cache.query_params(params)
+    ttl       = get_ttl(endpoint, dict(params), tier)
     limit     = DAILY_LIMITS.get(tier, 50)
-    cache_key = path.replace("/","_")
-
-    db = get_db()
-
-    # 1. current usage
-    usage_row = db.execute(
-        "SELECT count FROM api_usage WHERE user_id=? AND date=?", (uid, today)
-    ).fetchone()
-    current = usage_row["count"] if usage_row else 0
-
-    # 2. check cache
-    cache_row   = db.execute("SELECT response,fetched_at FROM api_cache WHERE cache_key=?", (cache_key,)).fetchone()
-    cache_hit   = False
-    response_data = None
-
-    if cache_row:
-        age = (datetime.utcnow() - datetime.fromisoformat(cache_row["fetched_at"])).total_seconds()
-        if age < ttl:
-            response_data = json.loads(cache_row["response"])
-            cache_hit     = True
-
-    # 3. real API call if stale
+    cache_key = cache.make_key(endpoint, params)
+    spec      = shape.spec_for(endpoint, None if admin else tier, opts)
+
+    # 0. league outside the plan → 403 before it costs anything; per-user bucket
+    #    + daily cap (advisory unless RATE_LIMIT_ENFORCE=1)
+    if not admin:
+        shape.check_league(endpoint, params, tier)
+        with metrics.span("ratelimit"):
+            ratelimit.users.check(user, await usage.aggregator.count_async(uid, today))
+
+    # 1–3. cache, stale-while-revalidate, upstream
+    entry, cache_hit, stale = await _resolve(user, endpoint, params, cache_key, ttl, today)
+
+    # 4. log usage (always) — counted in memory, flushed to SQLite in batches
+    with metrics.span("usage"):
+        new_count = await usage.aggregator.record_async(user, today, cache_hit)
+
+    # 5. the tier's leagues and the client's _options, cut from the cached payload;
+    #    everything below (ETag, 304, patch, gzip) works on that variant
+    if spec is not None:
+        with metrics.span("shape"):
+            entry = await shape.view_async(entry, spec)
+
+    # 6. conditional GET: same payload version as the client's copy → 304
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    held = request.headers.get("if-none-match")
+    if envelope.not_modified(held, entry.etag):
+        return Response(status_code=304, headers=headers)
+
+    # 7. delta: the client holds the version this entry replaced → send only the patch
+    with metrics.span("respond"):
+        if held and entry.prev is not None and envelope.DELTA_IM in request.headers.get("a-im", ""):
+            patch = cache.patch_from(entry, held) if entry.patch is not None else \
+                    await asyncio.to_thread(cache.patch_from, entry, held)
+            if patch:
+                return Response(envelope.patch_body(patch, envelope.tail(cache_hit, stale, new_count, limit)),
+                                status_code=226, media_type="application/json",
+                                headers={**headers, "IM": envelope.DELTA_IM})
+        return await _proxy_response(entry, envelope.tail(cache_hit, stale, new_count, limit),
+                                     request.headers.get("accept-encoding", ""), headers)
+
+async def _resolve(user, endpoint, params, cache_key, ttl, today):
+    # 1. check cache (memory first, api_cache refills it)
+    with metrics.span("cache_lookup"):
+        entry = await cache.lookup_async(cache_key)
+    cache_hit = bool(entry) and entry.age() < ttl
+    stale     = None
+    refresh   = upstream.refresher(cache_key, endpoint, params, ttl, user["id"], user["tier"])
+
+    # 2. stale-while-revalidate: answer from the expired entry, refresh behind it
+    if not cache_hit and entry and cache.CACHE_SWR and entry.age() < ttl + cache.SWR_MAX_STALE:
+        _revalidate(cache_key, refresh, today)
+        cache_hit, stale = True, "revalidating"
+
+    # 3. real API call if stale — concurrent misses share one upstream fetch
     if not cache_hit:
         try:
-            async with httpx.AsyncClient(timeout=15) as client:
-                r = await client.get(
-                    f"{FOOTBALL_API_BASE}/{path}",
-                    headers={"x-apisports-key": FOOTBALL_API_KEY}
-                )
-            if r.status_code != 200:
-                db.close()
-                raise HTTPException(r.status_code, f"Football API returned {r.status_code}")
-            response_data = r.json()
-        except httpx.TimeoutException:
-            db.close()
-            raise HTTPException(504, "Football API timeout — try again")
-
-        db.execute("""
-            INSERT INTO api_cache (cache_key,endpoint,response,fetched_at,fetched_by,fetched_tier)
-            VALUES (?,?,?,?,?,?)
-            ON CONFLICT(cache_key) DO UPDATE SET
-                response=excluded.response, fetched_at=excluded.fetched_at,
-                fetched_by=excluded.fetched_by, fetched_tier=excluded.fetched_tier
-        """, (cache_key, "/"+path, json.dumps(response_data),
-              datetime.utcnow().isoformat(), uid, tier))
-
-    # 4. log usage (always)
-    new_count = current + 1
-    db.execute("""
-        INSERT INTO api_usage (user_id,email,tier,date,count,cache_hits,real_calls,last_call)
-        VALUES (?,?,?,?,1,?,?,?)
-        ON CONFLICT(user_id,date) DO UPDATE SET
-            count=count+1, cache_hits=cache_hits+?, real_calls=real_calls+?,
-            last_call=excluded.last_call, tier=excluded.tier
-    """, (uid, user["email"], tier, today,
-          1 if cache_hit else 0, 0 if cache_hit else 1,
-          datetime.utcnow().isoformat(),
-          1 if cache_hit else 0, 0 if cache_hit else 1))
-
-    # 5. daily total
-    db.execute("""
-        INSERT INTO api_daily_total (date,total,cache_hits,real_calls) VALUES (?,1,?,?)
-        ON CONFLICT(date) DO UPDATE SET
-            total=total+1, cache_hits=cache_hits+?, real_calls=real_calls+?
-    """, (today,
-          1 if cache_hit else 0, 0 if cache_hit else 1,
-          1 if cache_hit else 0, 0 if cache_hit else 1))
-
-    db.commit(); db.close()
+            with metrics.span("upstream"):
+                (fresh, fetched), leader = await upstream.flights.do(cache_key, refresh)
+        except HTTPException:
+            # stale-if-error: keep serving the last good copy while api-sports is down
+            if not entry or entry.age() >= cache.STALE_IF_ERROR:
+                raise
+            cache_hit, stale = True, "upstream_error"
+        else:
+            entry, cache_hit = fresh, not (leader and fetched)
+
+    metrics.PROXY.labels(endpoint, user["tier"], "stale" if stale else "hit" if cache_hit else "miss").inc()
+    return entry, cache_hit, stale
+
+_background = set()
+
+def _revalidate(cache_key, refresh, today):
+    if upstream.flights.in_flight(cache_key):
+        return
+    task = asyncio.create_task(_background_refresh(cache_key, refresh, today))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+async def _background_refresh(cache_key, refresh, today):
+    try:
+        (_, fetched), leader = await upstream.flights.do(cache_key, refresh)
+    except HTTPException as e:
+        print(f"⚠️  background refresh of {cache_key} failed: {e.detail}")
+        return
+    if leader and fetched:
+        usage.aggregator.record_background(today)
+
+# splice the cached bytes into the envelope — no re-parse, no re-serialise of "data"
+async def _proxy_response(entry, tail: bytes, accept_encoding: str, headers: dict) -> Response:
+    if not envelope.wants_gzip(entry, accept_encoding):
+        return Response(envelope.body(entry, tail), media_type="application/json", headers=headers)
+    if entry.gz is None:
+        await asyncio.to_thread(envelope.prepare_gzip, entry)
+    return Response(envelope.gzip_body(entry, tail), media_type="application/json",
+                    headers={**headers, "Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+
+
+# ── Batch: several /football paths, one auth, one usage update ──
+#  Paths resolve concurrently through the same cache / single-flight /
+#  upstream path as GET /football; each still counts as one request toward the
+#  daily limit. A failing path gets its own status in "results", the rest are served.
+@app.post("/football/batch")
+async def football_batch(body: FootballBatchIn, user: dict = Depends(get_current_user)):
+    if not body.paths:
+        raise HTTPException(400, "No paths")
+    if len(body.paths) > FOOTBALL_BATCH_MAX:
+        raise HTTPException(400, f"At most {FOOTBALL_BATCH_MAX} paths per batch")
+    tier  = user["tier"]
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    admin = is_admin(user["email"])
+    limit = DAILY_LIMITS.get(tier, 50)
+    held  = body.etags or {}
 
-    return {
-        "data":      response_data,
-        "cache_hit": cache_hit,
-        "usage":     {"count": new_count, "limit": limit, "remaining": max(0, limit - new_count)},
-        "warn":      new_count >= int(limit * 0.8),
-        "over_limit": new_count > limit,
-    }
+    jobs, items = [], [None] * len(body.paths)
+    for i, path in enumerate(body.paths):
+        try:
+            url          = urlsplit(path)
+            params, opts = shape.split_params(parse_qsl(url.query, keep_blank_values=True))
+            endpoint     = cache.normalize_path(url.path)
+            params       = cache.query_params(params)
+            if not admin:
+                shape.check_league(endpoint, params, tier)
+            jobs.append((i, endpoint, params, shape.spec_for(endpoint, None if admin else tier, opts)))
+        except HTTPException as e:
+            items[i] = envelope.batch_error(path, e.status_code, e.detail)
+
+    if jobs and not admin:
+        with metrics.span("ratelimit"):
+            ratelimit.users.check(user, await usage.aggregator.count_async(user["id"], today), len(jobs))
+
+    async def one(i, endpoint, params, spec):
+        ttl = get_ttl(endpoint, dict(params), tier)
+        entry, cache_hit, stale = await _resolve(user, endpoint, params, cache.make_key(endpoint, params), ttl, today)
+        return await shape.view_async(entry, spec), cache_hit, stale
+
+    done = await asyncio.gather(*[one(*job) for job in jobs], return_exceptions=True)
+    hits = real = 0
+    for (i, *_), res in zip(jobs, done):
+        path = body.paths[i]
+        if isinstance(res, HTTPException):
+            items[i] = envelope.batch_error(path, res.status_code, res.detail)
+            continue
+        if isinstance(res, Exception):
+            # one broken path must not cost the others their answers (or their usage)
+            print(f"⚠️  batch path {path} failed: {res!r}")
+            items[i] = envelope.batch_error(path, 502, "Could not load this path — try again")
+            continue
+        if isinstance(res, BaseException):
+            raise res
+        entry, cache_hit, stale = res
+        hits, real = hits + cache_hit, real + (not cache_hit)
+        items[i] = envelope.batch_item(path, entry, cache_hit, stale,
+                                       with_data=not envelope.not_modified(held.get(path), entry.etag))
+
+    with metrics.span("usage"):
+        count = await usage.aggregator.record_split_async(user, today, hits, real) if hits + real else \
+                await usage.aggregator.count_async(user["id"], today)
+    return Response(envelope.batch_body(items, count, limit), media_type="application/json",
+                    headers={"Cache-Control": "private, no-cache"})
+
+
+# ── Live push ──────────────────────────────────────────────────
+# EventSource can't set headers, so the token may also come as ?token=
+@app.get("/live/stream")
+async def live_stream(token: Optional[str] = None, authorization: Optional[str] = Header(None),
+                      last_event_id: Optional[str] = Header(None)):
+    if authorization and authorization.startswith("Bearer "):
+        token = authorization.split(" ", 1)[1]
+    if not token:
+        raise HTTPException(401, "Missing token")
+    user = await _authenticate(token)
+    if live.hub.subscriber_count() >= live.LIVE_MAX_SUBS:
+        raise HTTPException(503, "Too many live subscribers — try again shortly")
+    # one usage hit per connection, however many updates it then receives
+    await usage.aggregator.record_async(user, datetime.utcnow().strftime("%Y-%m-%d"), True)
+    # identity encoding keeps GZipMiddleware from buffering the event stream
+    return StreamingResponse(live.hub.stream(user["tier"], last_event_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "Content-Encoding": "identity",
+                                      "X-Accel-Buffering": "no"})
 
 
 # ══════════════════════════════════════════════════════════════
@@ -261,10 +444,7 @@ async def football_proxy(path: str, user: dict = Depends(get_current_user)):
 @app.get("/usage/me")
 def usage_me(user: dict = Depends(get_current_user)):
     today = datetime.utcnow().strftime("%Y-%m-%d")
-    db    = get_db()
-    row   = db.execute("SELECT * FROM api_usage WHERE user_id=? AND date=?", (user["id"], today)).fetchone()
-    db.close()
-    data  = row_to_dict(row) or {"count": 0, "cache_hits": 0, "real_calls": 0}
+    data  = usage.aggregator.current(user["id"], today)
     limit = DAILY_LIMITS.get(user["tier"], 50)
     count = data.get("count", 0)
     return {
@@ -284,35 +464,32 @@ def usage_me(user: dict = Depends(get_current_user)):
 # ══════════════════════════════════════════════════════════════
 
 @app.post("/subscriptions/request")
-def sub_request(body: SubRequestIn, user: dict = Depends(get_current_user)):
+def sub_request(body: SubRequestIn, user: dict = Depends(get_current_user), db = Depends(db_session)):
     if body.tier not in ("starter", "pro", "premium"):
         raise HTTPException(400, "Invalid tier")
     if user["tier"] == body.tier:
         raise HTTPException(400, "Already on this tier")
 
-    db = get_db()
     existing = db.execute(
         "SELECT id FROM sub_requests WHERE user_id=? AND status='pending'", (user["id"],)
     ).fetchone()
     if existing:
-        db.close()
         raise HTTPException(400, "You already have a pending request")
 
     db.execute(
         "INSERT INTO sub_requests (user_id,email,name,whatsapp,requested_tier) VALUES (?,?,?,?,?)",
         (user["id"], user["email"], user["name"], body.whatsapp or user["whatsapp"], body.tier)
     )
-    db.commit(); db.close()
+    stats.apply(db, {"pending_reqs": 1})
+    db.commit()
     return {"ok": True, "message": "Request submitted. Admin will review soon."}
 
 
 @app.get("/subscriptions/mine")
-def my_sub(user: dict = Depends(get_current_user)):
-    db  = get_db()
+def my_sub(user: dict = Depends(get_current_user), db = Depends(db_session)):
     row = db.execute(
         "SELECT * FROM sub_requests WHERE user_id=? ORDER BY created_at DESC LIMIT 1", (user["id"],)
     ).fetchone()
-    db.close()
     return row_to_dict(row) or {}
 
 
@@ -321,26 +498,24 @@ def my_sub(user: dict = Depends(get_current_user)):
 # ══════════════════════════════════════════════════════════════
 
 @app.get("/notifications")
-def get_notifs(user: dict = Depends(get_current_user)):
-    db   = get_db()
+def get_notifs(user: dict = Depends(get_current_user), db = Depends(db_session)):
     rows = db.execute(
         "SELECT * FROM notifications WHERE user_id=? ORDER BY created_at DESC LIMIT 20", (user["id"],)
     ).fetchall()
-    db.close()
     return rows_to_list(rows)
 
 @app.post("/notifications/{nid}/read")
-def mark_read(nid: int, user: dict = Depends(get_current_user)):
-    db = get_db()
-    db.execute("UPDATE notifications SET read=1 WHERE id=? AND user_id=?", (nid, user["id"]))
-    db.commit(); db.close()
+def mark_read(nid: int, user: dict = Depends(get_current_user), db = Depends(db_session)):
+    cur = db.execute("UPDATE notifications SET read=1 WHERE id=? AND user_id=? AND read=0", (nid, user["id"]))
+    stats.apply(db, {"unread_notifs": -cur.rowcount})
+    db.commit()
     return {"ok": True}
 
 @app.post("/notifications/read-all")
-def mark_all_read(user: dict = Depends(get_current_user)):
-    db = get_db()
-    db.execute("UPDATE notifications SET read=1 WHERE user_id=?", (user["id"],))
-    db.commit(); db.close()
+def mark_all_read(user: dict = Depends(get_current_user), db = Depends(db_session)):
+    cur = db.execute("UPDATE notifications SET read=1 WHERE user_id=? AND read=0", (user["id"],))
+    stats.apply(db, {"unread_notifs": -cur.rowcount})
+    db.commit()
     return {"ok": True}
 
 
@@ -349,127 +524,213 @@ def mark_all_read(user: dict = Depends(get_current_user)):
 # ══════════════════════════════════════════════════════════════
 
 @app.get("/admin/stats")
-def admin_stats(admin: dict = Depends(require_admin)):
+def admin_stats(admin: dict = Depends(require_admin), db = Depends(db_session)):
     today = datetime.utcnow().strftime("%Y-%m-%d")
-    db    = get_db()
-    total_users    = db.execute("SELECT COUNT(*) as n FROM users").fetchone()["n"]
-    tier_counts    = rows_to_list(db.execute("SELECT tier, COUNT(*) as n FROM users GROUP BY tier").fetchall())
-    pending_reqs   = db.execute("SELECT COUNT(*) as n FROM sub_requests WHERE status='pending'").fetchone()["n"]
-    new_today      = db.execute("SELECT COUNT(*) as n FROM users WHERE date(created_at)=?", (today,)).fetchone()["n"]
-    api_today      = db.execute("SELECT * FROM api_daily_total WHERE date=?", (today,)).fetchone()
-    unread_notifs  = db.execute("SELECT COUNT(*) as n FROM notifications WHERE read=0").fetchone()["n"]
-    db.close()
-
-    tiers = {r["tier"]: r["n"] for r in tier_counts}
-    mrr   = (tiers.get("starter",0)*3 + tiers.get("pro",0)*5 + tiers.get("premium",0)*10)
+    usage.aggregator.flush()
+    counters  = stats.read(db)
+    daily     = db.execute("SELECT new_users FROM stats_daily WHERE date=?", (today,)).fetchone()
+    api_today = usage_store.get().usage_daily(today)
+
+    tiers = stats.tiers_of(counters)
     return {
-        "total_users":   total_users,
-        "new_today":     new_today,
-        "pending_reqs":  pending_reqs,
-        "unread_notifs": unread_notifs,
-        "mrr":           mrr,
+        "total_users":   counters.get("users", 0),
+        "new_today":     daily["new_users"] if daily else 0,
+        "pending_reqs":  counters.get("pending_reqs", 0),
+        "unread_notifs": counters.get("unread_notifs", 0),
+        "mrr":           stats.mrr_of(tiers),
         "tiers":         tiers,
-        "api_today":     row_to_dict(api_today) or {"total":0,"cache_hits":0,"real_calls":0},
+        "api_today":     api_today or {"total":0,"cache_hits":0,"real_calls":0},
     }
 
-@app.get("/admin/users")
-def admin_users(admin: dict = Depends(require_admin)):
-    db   = get_db()
-    rows = db.execute(
-        "SELECT id,email,name,whatsapp,tier,status,created_at,last_login FROM users ORDER BY created_at DESC"
-    ).fetchall()
-    db.close()
-    return rows_to_list(rows)
+@app.get("/admin/stats/history")
+def admin_stats_history(days: int = 30, admin: dict = Depends(require_admin), db = Depends(db_session)):
+    return stats.history(db, days)
 
+@app.get("/admin/users")
+def admin_users(limit: int = listing.PAGE_DEFAULT, after_id: Optional[int] = None,
+                tier: Optional[str] = None, status: Optional[str] = None,
+                created_from: Optional[str] = None, created_to: Optional[str] = None,
+                admin: dict = Depends(require_admin), db = Depends(db_session)):
+    return listing.page(db, listing.USERS, limit, after_id, tier=tier, status=status,
+                        created_from=created_from, created_to=created_to)
+
+@app.get("/admin/users/export")
+def export_users(format: str = "ndjson", tier: Optional[str] = None, status: Optional[str] = None,
+                 created_from: Optional[str] = None, created_to: Optional[str] = None,
+                 admin: dict = Depends(require_admin)):
+    return _export("users", listing.USERS, format, tier=tier, status=status,
+                   created_from=created_from, created_to=created_to)
+
+# status="" lists every status
 @app.get("/admin/requests")
-def admin_requests(status: str = "pending", admin: dict = Depends(require_admin)):
-    db   = get_db()
-    rows = db.execute(
-        "SELECT * FROM sub_requests WHERE status=? ORDER BY created_at DESC", (status,)
-    ).fetchall()
-    db.close()
-    return rows_to_list(rows)
+def admin_requests(status: str = "pending", limit: int = listing.PAGE_DEFAULT, after_id: Optional[int] = None,
+                   tier: Optional[str] = None, created_from: Optional[str] = None, created_to: Optional[str] = None,
+                   admin: dict = Depends(require_admin), db = Depends(db_session)):
+    return listing.page(db, listing.REQUESTS, limit, after_id, tier=tier, status=status,
+                        created_from=created_from, created_to=created_to)
+
+@app.get("/admin/requests/export")
+def export_requests(format: str = "ndjson", status: Optional[str] = None, tier: Optional[str] = None,
+                    created_from: Optional[str] = None, created_to: Optional[str] = None,
+                    admin: dict = Depends(require_admin)):
+    return _export("requests", listing.REQUESTS, format, tier=tier, status=status,
+                   created_from=created_from, created_to=created_to)
+
+def _export(name, spec, fmt, **filters) -> StreamingResponse:
+    if fmt not in listing.EXPORT_TYPES:
+        raise HTTPException(400, f"format must be one of {list(listing.EXPORT_TYPES)}")
+    stamp = datetime.utcnow().strftime("%Y%m%d")
+    return StreamingResponse(listing.export(spec, fmt, **filters), media_type=listing.EXPORT_TYPES[fmt],
+                             headers={"Content-Disposition": f'attachment; filename="{name}-{stamp}.{fmt}"'})
 
 @app.post("/admin/requests/action")
-def request_action(body: RequestActionIn, admin: dict = Depends(require_admin)):
+def request_action(body: RequestActionIn, admin: dict = Depends(require_admin), db = Depends(db_session)):
     if body.action not in ("approve", "reject"):
         raise HTTPException(400, "action must be approve or reject")
-
-    db  = get_db()
-    req = row_to_dict(db.execute("SELECT * FROM sub_requests WHERE id=?", (body.request_id,)).fetchone())
-    if not req:
-        db.close(); raise HTTPException(404, "Request not found")
-
-    now = datetime.utcnow().isoformat()
-    db.execute("UPDATE sub_requests SET status=?,admin_note=?,resolved_at=? WHERE id=?",
-               (body.action + "d", body.note or "", now, body.request_id))
-
-    if body.action == "approve":
-        user = row_to_dict(db.execute("SELECT tier FROM users WHERE id=?", (req["user_id"],)).fetchone())
-        old  = user["tier"] if user else "free"
-        db.execute("UPDATE users SET tier=? WHERE id=?", (req["requested_tier"], req["user_id"]))
-        db.execute("INSERT INTO tier_changes (user_id,old_tier,new_tier,changed_by,note) VALUES (?,?,?,?,?)",
-                   (req["user_id"], old, req["requested_tier"], admin["email"], body.note or ""))
-        db.execute("INSERT INTO notifications (user_id,type,message) VALUES (?,?,?)",
-                   (req["user_id"], "tier_approved",
-                    f"🎉 Your {req['requested_tier'].title()} plan is now active! Enjoy your new features."))
-
-    else:
-        db.execute("INSERT INTO notifications (user_id,type,message) VALUES (?,?,?)",
-                   (req["user_id"], "tier_rejected",
-                    f"Your {req['requested_tier'].title()} request was not approved. {body.note or 'Contact admin for details.'}"))
-
-    db.commit(); db.close()
+    results, touched = admin_ops.resolve_requests(db, admin["email"], [body.request_id], body.action, body.note)
+    if not results[0]["ok"]:
+        raise HTTPException(404, results[0]["error"])
+    db.commit()
+    for uid in touched:
+        invalidate_user(uid)
     return {"ok": True}
 
+@app.post("/admin/requests/bulk-action")
+def bulk_request_action(body: BulkRequestActionIn, admin: dict = Depends(require_admin), db = Depends(db_session)):
+    if body.action not in ("approve", "reject"):
+        raise HTTPException(400, "action must be approve or reject")
+    _check_bulk(body.request_ids)
+    results, touched = admin_ops.resolve_requests(db, admin["email"], body.request_ids, body.action, body.note)
+    db.commit()
+    for uid in touched:
+        invalidate_user(uid)
+    return _bulk_response(results)
+
 @app.post("/admin/users/change-tier")
-def change_tier(body: TierChangeIn, admin: dict = Depends(require_admin)):
+def change_tier(body: TierChangeIn, admin: dict = Depends(require_admin), db = Depends(db_session)):
     if body.new_tier not in TIERS:
         raise HTTPException(400, f"Invalid tier. Choose from {list(TIERS)}")
-    db   = get_db()
-    user = row_to_dict(db.execute("SELECT * FROM users WHERE id=?", (body.user_id,)).fetchone())
-    if not user:
-        db.close(); raise HTTPException(404, "User not found")
-    db.execute("UPDATE users SET tier=? WHERE id=?", (body.new_tier, body.user_id))
-    db.execute("INSERT INTO tier_changes (user_id,old_tier,new_tier,changed_by,note) VALUES (?,?,?,?,?)",
-               (body.user_id, user["tier"], body.new_tier, admin["email"], body.note or ""))
-    db.execute("INSERT INTO notifications (user_id,type,message) VALUES (?,?,?)",
-               (body.user_id, "tier_changed", f"Your plan has been updated to {body.new_tier.title()}."))
-    db.commit(); db.close()
+    results, touched = admin_ops.change_tiers(db, admin["email"], [body.user_id], body.new_tier, body.note)
+    if not results[0]["ok"]:
+        raise HTTPException(404, results[0]["error"])
+    db.commit()
+    invalidate_user(body.user_id)
     return {"ok": True}
 
+@app.post("/admin/users/bulk-change-tier")
+def bulk_change_tier(body: BulkTierChangeIn, admin: dict = Depends(require_admin), db = Depends(db_session)):
+    if body.new_tier not in TIERS:
+        raise HTTPException(400, f"Invalid tier. Choose from {list(TIERS)}")
+    _check_bulk(body.user_ids)
+    results, touched = admin_ops.change_tiers(db, admin["email"], body.user_ids, body.new_tier, body.note)
+    db.commit()
+    for uid in touched:
+        invalidate_user(uid)
+    return _bulk_response(results)
+
+def _check_bulk(ids):
+    if not ids:
+        raise HTTPException(400, "No ids given")
+    if len(ids) > admin_ops.BULK_MAX:
+        raise HTTPException(400, f"At most {admin_ops.BULK_MAX} ids per call")
+
+def _bulk_response(results) -> dict:
+    done = sum(1 for r in results if r["ok"])
+    return {"ok": done == len(results), "applied": done, "failed": len(results) - done, "results": results}
+
 @app.post("/admin/users/status")
-def change_status(body: UserStatusIn, admin: dict = Depends(require_admin)):
+def change_status(body: UserStatusIn, admin: dict = Depends(require_admin), db = Depends(db_session)):
     if body.status not in ("active", "disabled"):
         raise HTTPException(400, "status must be active or disabled")
-    db = get_db()
+    user = row_to_dict(db.execute("SELECT status FROM users WHERE id=?", (body.user_id,)).fetchone())
     db.execute("UPDATE users SET status=? WHERE id=?", (body.status, body.user_id))
-    db.commit(); db.close()
+    if user and user["status"] != body.status:
+        stats.apply(db, {"disabled": 1 if body.status == "disabled" else -1})
+    db.commit()
+    invalidate_user(body.user_id)
     return {"ok": True}
 
 @app.get("/admin/usage/daily")
 def admin_daily(days: int = 7, admin: dict = Depends(require_admin)):
-    db, rows = get_db(), []
+    usage.aggregator.flush()
+    rows = []
     for i in range(days):
-        d   = (datetime.utcnow() - timedelta(days=i)).strftime("%Y-%m-%d")
-        row = db.execute("SELECT * FROM api_daily_total WHERE date=?", (d,)).fetchone()
-        rows.append(row_to_dict(row) or {"date": d, "total": 0, "cache_hits": 0, "real_calls": 0})
-    db.close()
+        d = (datetime.utcnow() - timedelta(days=i)).strftime("%Y-%m-%d")
+        rows.append(usage_store.get().usage_daily(d) or {"date": d, "total": 0, "cache_hits": 0, "real_calls": 0})
     return rows
 
 @app.get("/admin/usage/users")
 def admin_usage_users(date: str = None, admin: dict = Depends(require_admin)):
     date = date or datetime.utcnow().strftime("%Y-%m-%d")
-    db   = get_db()
-    rows = db.execute(
-        "SELECT * FROM api_usage WHERE date=? ORDER BY count DESC LIMIT 50", (date,)
-    ).fetchall()
-    db.close()
-    return rows_to_list(rows)
+    usage.aggregator.flush()
+    return usage_store.get().usage_top(date, 50)
 
+# ?prefix=fixtures drops only keys starting with it; no prefix wipes everything
 @app.delete("/admin/cache")
-def clear_cache(admin: dict = Depends(require_admin)):
-    db = get_db()
-    db.execute("DELETE FROM api_cache")
-    db.commit(); db.close()
+def clear_cache(prefix: Optional[str] = None, admin: dict = Depends(require_admin)):
+    if prefix:
+        n = cache.invalidate(prefix)
+        return {"ok": True, "message": f"Invalidated {n} cached responses", "deleted": n}
+    cache.clear()
     return {"ok": True, "message": "Cache cleared"}
+
+@app.get("/admin/cache/stats")
+def cache_stats(admin: dict = Depends(require_admin)):
+    return cache.stats()
+
+@app.get("/admin/upstream/stats")
+def upstream_stats(admin: dict = Depends(require_admin)):
+    return upstream.stats()
+
+@app.get("/admin/usage/stats")
+def usage_stats(admin: dict = Depends(require_admin)):
+    return usage.aggregator.stats()
+
+@app.get("/admin/auth/stats")
+def auth_stats(admin: dict = Depends(require_admin)):
+    return hash_stats()
+
+@app.get("/admin/db/stats")
+def db_stats(admin: dict = Depends(require_admin)):
+    return database.pool_stats()
+
+@app.get("/admin/store/stats")
+def store_stats(admin: dict = Depends(require_admin)):
+    return usage_store.get().stats()
+
+@app.get("/admin/ratelimit/stats")
+def ratelimit_stats(admin: dict = Depends(require_admin)):
+    return ratelimit.stats()
+
+@app.get("/admin/live/stats")
+def live_stats(admin: dict = Depends(require_admin)):
+    return live.hub.stats()
+
+# ── Prometheus scrape ──────────────────────────────────────────
+_CACHE_ENTRIES = metrics.Gauge("t3n28_cache_memory_entries", "Entries in the in-process response cache")
+_CACHE_BYTES   = metrics.Gauge("t3n28_cache_memory_bytes", "Bytes held by the in-process response cache")
+_USAGE_PENDING = metrics.Gauge("t3n28_usage_pending_rows", "Usage rows waiting for the next flush")
+_DB_IDLE       = metrics.Gauge("t3n28_sqlite_pool_idle", "Idle pooled SQLite connections")
+_LIVE_SUBS     = metrics.Gauge("t3n28_live_subscribers", "Open /live/stream subscribers", ("tier",))
+_BUDGET_SPENT  = metrics.Gauge("t3n28_upstream_budget_spent", "api-sports calls spent today (this worker)")
+
+@metrics.on_scrape
+def _scrape():
+    mem = cache.memory.stats()
+    _CACHE_ENTRIES.set(mem["entries"])
+    _CACHE_BYTES.set(mem["bytes"])
+    _USAGE_PENDING.set(usage.aggregator.stats()["pending_rows"])
+    _DB_IDLE.set(database.pool_stats()["idle"])
+    for tier, n in live.hub.stats()["subscribers"].items():
+        _LIVE_SUBS.labels(tier).set(n)
+    _BUDGET_SPENT.set(ratelimit.upstream.spent)
+
+@app.get("/metrics")
+def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    if metrics.METRICS_TOKEN and authorization != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(401, "Missing or wrong metrics token")
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/admin/prefetch/stats")
+def prefetch_stats(admin: dict = Depends(require_admin)):
+    return prefetch.prefetcher.stats()
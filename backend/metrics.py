@@ -0,0 +1,231 @@
+import os, time, bisect, threading, contextvars
+
+# ── Prometheus metrics (text format 0.0.4, no client library) ──
+#  Counters, gauges and histograms with labels, rendered on GET /metrics.
+#  span("stage") times one step of a request into t3n28_request_stage_seconds
+#  and into the request's own breakdown, which Middleware prints when the
+#  request took longer than METRICS_SLOW_MS (0 = off). Hit ratio is a PromQL
+#  query over t3n28_proxy_requests_total{result}. Every metric keeps at most
+#  METRICS_MAX_SERIES label sets; the rest are folded into "other", since
+#  endpoint labels come from client paths.
+
+METRICS_SLOW_MS    = float(os.environ.get("METRICS_SLOW_MS", 0))
+METRICS_MAX_SERIES = int(os.environ.get("METRICS_MAX_SERIES", 500))
+METRICS_TOKEN      = os.environ.get("METRICS_TOKEN", "")   # set → /metrics needs Bearer <token>
+
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+_registry  = []
+_on_scrape = []
+_stages    = contextvars.ContextVar("stages", default=None)
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values, extra="") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _num(v) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name       = name
+        self.help       = help
+        self.labelnames = tuple(labels)
+        self._children  = {}
+        self._lock      = threading.Lock()
+        _registry.append(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                if len(self._children) >= METRICS_MAX_SERIES:
+                    values = ("other",) * len(self.labelnames)
+                child = self._children.setdefault(values, self._new())
+        return child
+
+    def render(self) -> list:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            out.extend(self._samples(values, child))
+        return out
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self, lock):
+        self.value = 0.0
+        self._lock = lock
+
+    def inc(self, n: float = 1):
+        with self._lock:
+            self.value += n
+
+    def dec(self, n: float = 1):
+        with self._lock:
+            self.value -= n
+
+    def set(self, v: float):
+        self.value = v
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new(self):
+        return _Value(self._lock)
+
+    def inc(self, n: float = 1):
+        self.labels().inc(n)
+
+    def _samples(self, values, child):
+        return [f"{self.name}{_labels(self.labelnames, values)} {_num(child.value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, n: float = 1):
+        self.labels().dec(n)
+
+    def set(self, v: float):
+        self.labels().set(v)
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds, lock):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum    = 0.0
+        self._lock  = lock
+
+    def observe(self, v: float):
+        i = bisect.bisect_left(self.bounds, v)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum       += v
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def _new(self):
+        return _Buckets(self.buckets, self._lock)
+
+    def observe(self, v: float):
+        self.labels().observe(v)
+
+    def _samples(self, values, child):
+        with self._lock:
+            counts, total = list(child.counts), child.sum
+        out, acc = [], 0
+        for bound, n in zip(self.buckets + ("+Inf",), counts):
+            acc += n
+            le   = 'le="%s"' % (bound if bound == "+Inf" else _num(bound))
+            out.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {acc}")
+        lbl = _labels(self.labelnames, values)
+        out.append(f"{self.name}_sum{lbl} {repr(total)}")
+        out.append(f"{self.name}_count{lbl} {acc}")
+        return out
+
+
+# ── What we measure ──
+IN_FLIGHT  = Gauge("t3n28_http_requests_in_flight", "HTTP requests being served (open SSE streams included)")
+HTTP_TIME  = Histogram("t3n28_http_request_duration_seconds", "Time to the last response byte", ("route", "method"))
+HTTP_TOTAL = Counter("t3n28_http_requests_total", "HTTP responses", ("route", "method", "status"))
+STAGE_TIME = Histogram("t3n28_request_stage_seconds", "Time spent per request stage", ("stage",))
+PROXY      = Counter("t3n28_proxy_requests_total", "/football answers by cache result (hit|miss|stale)",
+                     ("endpoint", "tier", "result"))
+UPSTREAM   = Histogram("t3n28_upstream_request_seconds", "api-sports round trip, slot wait included",
+                       ("endpoint", "outcome"))
+LOCK_WAIT  = Histogram("t3n28_sqlite_lock_wait_seconds", "Wait for the SQLite write lock (BEGIN IMMEDIATE)",
+                       ("op",), buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5))
+
+
+class span:
+    __slots__ = ("stage", "t0")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.t0
+        STAGE_TIME.labels(self.stage).observe(dt)
+        stages = _stages.get()
+        if stages is not None:
+            stages[self.stage] = stages.get(self.stage, 0.0) + dt
+
+
+# fn() runs before each render, to copy point-in-time stats into gauges
+def on_scrape(fn):
+    _on_scrape.append(fn)
+    return fn
+
+def render() -> str:
+    for fn in _on_scrape:
+        try:
+            fn()
+        except Exception as e:
+            print(f"⚠️  metrics collector failed: {e!r}")
+    lines = []
+    for m in _registry:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# ── ASGI middleware: in-flight gauge, per-route timing, slow-request log ──
+class Middleware:
+    def __init__(self, app, slow_ms: float = METRICS_SLOW_MS):
+        self.app     = app
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0     = time.perf_counter()
+        stages = {}
+        state  = {"status": 500, "stream": False, "done": None}
+        _stages.set(stages)
+        IN_FLIGHT.inc()
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                state["stream"] = any(k == b"content-type" and v.startswith(b"text/event-stream")
+                                      for k, v in message.get("headers", ()))
+            elif message["type"] == "http.response.body" and not message.get("more_body"):
+                state["done"] = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            IN_FLIGHT.dec()
+            route  = getattr(scope.get("route"), "path", "other")
+            method = scope["method"]
+            dt     = (state["done"] or time.perf_counter()) - t0
+            HTTP_TIME.labels(route, method).observe(dt)
+            HTTP_TOTAL.labels(route, method, state["status"]).inc()
+            if self.slow_ms and dt * 1000 >= self.slow_ms and not state["stream"]:
+                parts = " ".join(f"{k}={v * 1000:.1f}ms" for k, v in stages.items())
+                print(f"🐢 slow {method} {scope['path']} {state['status']} {dt * 1000:.0f}ms {parts}")
@@ -0,0 +1,130 @@
+import os, time, random, asyncio
+from datetime import datetime
+from fastapi import HTTPException
+
+import cache, upstream, usage
+from auth import TOP15_LEAGUE_IDS
+
+# ── Prefetch scheduler: keep the dashboard/standings keys warm ─────
+#  Each hot key is refreshed PREFETCH_LEAD seconds before it would expire,
+#  minus a random jitter, and never past the daily upstream budget.
+
+PREFETCH_ENABLED   = os.environ.get("PREFETCH_ENABLED", "1") == "1"
+PREFETCH_TICK      = float(os.environ.get("PREFETCH_TICK", 5))
+PREFETCH_LEAD      = float(os.environ.get("PREFETCH_LEAD", 10))
+PREFETCH_JITTER    = float(os.environ.get("PREFETCH_JITTER", 0.1))
+PREFETCH_BUDGET    = int(os.environ.get("PREFETCH_DAILY_BUDGET", 2000))
+PREFETCH_LIVE      = int(os.environ.get("PREFETCH_LIVE_EVERY", 60))
+PREFETCH_TODAY     = int(os.environ.get("PREFETCH_TODAY_EVERY", 600))
+PREFETCH_STANDINGS = int(os.environ.get("PREFETCH_STANDINGS_EVERY", 3600))
+
+
+def current_season(now: datetime) -> int:
+    # European seasons start in July; api-sports names them by the start year
+    return now.year if now.month >= 7 else now.year - 1
+
+
+# what standings.html offers (newest first, sent with the user) — the page
+# opens on the first, so that one is what gets prefetched
+def seasons(now: datetime = None) -> list:
+    season = current_season(now or datetime.utcnow())
+    return [season, season - 1]
+
+
+def hot_endpoints(now: datetime) -> list:
+    today  = now.strftime("%Y-%m-%d")
+    season = str(seasons(now)[0])
+    jobs   = []
+    if PREFETCH_LIVE:
+        jobs.append(("fixtures", [("live", "all")], PREFETCH_LIVE))
+    if PREFETCH_TODAY:
+        jobs.append(("fixtures", [("date", today), ("status", "NS")], PREFETCH_TODAY))
+    if PREFETCH_STANDINGS:
+        jobs += [("standings", [("league", str(lid)), ("season", season)], PREFETCH_STANDINGS)
+                 for lid in TOP15_LEAGUE_IDS]
+    return jobs
+
+
+class Prefetcher:
+    def __init__(self, jobs=hot_endpoints, budget=PREFETCH_BUDGET,
+                 lead=PREFETCH_LEAD, jitter=PREFETCH_JITTER):
+        self.jobs     = jobs
+        self.budget   = budget
+        self.lead     = lead
+        self.jitter   = jitter
+        self.day      = None
+        self.spent    = 0
+        self.refreshed = self.skipped = self.errors = 0
+        self._due     = {}
+        self._task    = None
+
+    async def tick(self, now: datetime = None):
+        now = now or datetime.utcnow()
+        day = now.strftime("%Y-%m-%d")
+        if day != self.day:
+            self.day, self.spent = day, 0
+
+        for endpoint, params, every in self.jobs(now):
+            key = cache.make_key(endpoint, params)
+            if self._due.get(key, 0) > time.time():
+                continue
+            entry  = await cache.lookup_async(key)
+            window = max(every - self.lead, 1)
+            if entry and entry.age() < window:
+                self._schedule(key, entry.fetched_at, every)
+                continue
+            if self.spent >= self.budget:
+                self.skipped += 1
+                continue
+            try:
+                (entry, fetched), leader = await upstream.flights.do(
+                    key, upstream.refresher(key, endpoint, params, window, tier="prefetch"))
+            except HTTPException as e:
+                self.errors += 1
+                self._due[key] = time.time() + min(every, 60)
+                print(f"⚠️  prefetch {key} failed: {e.detail}")
+                continue
+            if leader and fetched:
+                self.spent     += 1
+                self.refreshed += 1
+                usage.aggregator.record_background(day)
+            self._schedule(key, entry.fetched_at, every)
+
+    def _schedule(self, key, fetched_at, every):
+        self._due[key] = fetched_at + every - self.lead - random.uniform(0, self.jitter * every)
+
+    async def run(self, interval: float = PREFETCH_TICK):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:   # keep the loop alive; next tick retries
+                print(f"⚠️  prefetch tick failed: {e!r}")
+            await asyncio.sleep(interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled":   self._task is not None,
+            "date":      self.day,
+            "budget":    self.budget,
+            "spent":     self.spent,
+            "refreshed": self.refreshed,
+            "skipped":   self.skipped,
+            "errors":    self.errors,
+            "keys":      len(self._due),
+        }
+
+
+prefetcher = Prefetcher()
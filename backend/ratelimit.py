@@ -0,0 +1,161 @@
+import os, time, asyncio
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+
+from auth import DAILY_LIMITS
+
+# ── In-process rate limiting ───────────────────────────────────
+#  users:    one token bucket per user, sized from the tier's daily limit, plus
+#            the daily cap itself (checked against usage.aggregator's count).
+#            Advisory unless RATE_LIMIT_ENFORCE=1, then 429 + Retry-After.
+#  upstream: global api-sports budget per minute (bucket) and per UTC day.
+#            A miss may only spend a token while more than its tier's reserve
+#            is left, so as quota runs low free traffic stops first and
+#            premium keeps getting fresh data; denied fetches wait briefly and
+#            then fail with 503, which the proxy answers from stale cache.
+#  Everything is O(1) per request and stays in memory.
+
+RATE_LIMIT_ENFORCE  = os.environ.get("RATE_LIMIT_ENFORCE", "0") == "1"
+RATE_DAY_DIVISOR    = int(os.environ.get("RATE_DAY_DIVISOR", 20))      # per-minute rate = daily limit / this
+RATE_MIN_PER_MINUTE = int(os.environ.get("RATE_MIN_PER_MINUTE", 10))
+RATE_MAX_USERS      = int(os.environ.get("RATE_MAX_USERS", 100000))    # buckets kept before idle ones are pruned
+
+UPSTREAM_PER_MINUTE = int(os.environ.get("UPSTREAM_PER_MINUTE", 300))
+UPSTREAM_PER_DAY    = int(os.environ.get("UPSTREAM_PER_DAY", 7500))
+UPSTREAM_MAX_WAIT   = float(os.environ.get("UPSTREAM_MAX_WAIT", 2.0))
+
+# share of the minute/day budget a tier must leave for the tiers above it;
+# background work (prefetch, revalidation without a user) ranks last
+UPSTREAM_RESERVE = {"premium": 0.0, "live": 0.05, "pro": 0.1, "starter": 0.2, "free": 0.3}
+BACKGROUND_RESERVE = 0.4
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate     = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens   = self.capacity
+        self.updated  = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens  = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def level(self, now: float = None) -> float:
+        self._refill(now or time.monotonic())
+        return self.tokens
+
+    # (taken, seconds until `n` tokens would be there)
+    def take(self, n: float = 1, floor: float = 0.0, now: float = None):
+        self._refill(now or time.monotonic())
+        if self.tokens - n >= floor:
+            self.tokens -= n
+            return True, 0.0
+        return False, (floor + n - self.tokens) / self.rate if self.rate else float("inf")
+
+
+def _until_midnight(now: datetime = None) -> int:
+    now = now or datetime.utcnow()
+    return int((datetime(now.year, now.month, now.day) + timedelta(days=1) - now).total_seconds()) + 1
+
+
+def user_rate(tier: str) -> int:
+    return max(RATE_MIN_PER_MINUTE, DAILY_LIMITS.get(tier, 50) // RATE_DAY_DIVISOR)
+
+
+class UserLimiter:
+    def __init__(self, enforce=RATE_LIMIT_ENFORCE, max_users=RATE_MAX_USERS):
+        self.enforce   = enforce
+        self.max_users = max_users
+        self.allowed = self.limited = self.daily_capped = 0
+        self._buckets  = {}   # uid -> (tier, TokenBucket)
+
+    def _bucket(self, uid, tier) -> TokenBucket:
+        held = self._buckets.get(uid)
+        if held is None or held[0] != tier:
+            if len(self._buckets) >= self.max_users:
+                self._prune()
+            held = self._buckets[uid] = (tier, TokenBucket(user_rate(tier)))
+        return held[1]
+
+    # idle users' buckets are full again; dropping them loses nothing
+    def _prune(self):
+        now = time.monotonic()
+        for uid in [u for u, (_, b) in self._buckets.items() if b.level(now) >= b.capacity]:
+            del self._buckets[uid]
+
+    # count = the user's requests so far today, before these n
+    def check(self, user: dict, count: int, n: int = 1):
+        limit = DAILY_LIMITS.get(user["tier"], 50)
+        if count + n > limit:
+            self.daily_capped += 1
+            if self.enforce:
+                raise HTTPException(429, f"Daily limit of {limit} requests reached — resets at midnight UTC",
+                                    headers={"Retry-After": str(_until_midnight())})
+        bucket   = self._bucket(user["id"], user["tier"])
+        ok, wait = bucket.take(min(n, bucket.capacity))   # a batch never needs more than a full bucket
+        if not ok:
+            self.limited += 1
+            if self.enforce:
+                raise HTTPException(429, "Too many requests — slow down",
+                                    headers={"Retry-After": str(max(1, int(wait + 0.999)))})
+        self.allowed += 1
+
+    def stats(self) -> dict:
+        return {"enforce": self.enforce, "tracked_users": len(self._buckets), "allowed": self.allowed,
+                "rate_limited": self.limited, "daily_capped": self.daily_capped}
+
+
+class UpstreamBudget:
+    def __init__(self, per_minute=UPSTREAM_PER_MINUTE, per_day=UPSTREAM_PER_DAY, max_wait=UPSTREAM_MAX_WAIT):
+        self.minute   = TokenBucket(per_minute)
+        self.per_day  = per_day
+        self.max_wait = max_wait
+        self.day      = None
+        self.spent    = 0
+        self.granted = self.waited = self.denied = 0
+
+    def _reserve(self, tier) -> float:
+        return UPSTREAM_RESERVE.get(tier, BACKGROUND_RESERVE)
+
+    def try_take(self, tier=None):
+        today = datetime.utcnow().strftime("%Y-%m-%d")
+        if today != self.day:
+            self.day, self.spent = today, 0
+        reserve = self._reserve(tier)
+        if self.per_day - self.spent <= reserve * self.per_day:
+            return False, _until_midnight()
+        ok, wait = self.minute.take(floor=reserve * self.minute.capacity)
+        if ok:
+            self.spent   += 1
+            self.granted += 1
+        return ok, wait
+
+    async def acquire(self, tier=None):
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            ok, wait = self.try_take(tier)
+            if ok:
+                return
+            left = deadline - time.monotonic()
+            if wait > left:
+                self.denied += 1
+                raise HTTPException(503, "Football API budget exhausted — try again shortly",
+                                    headers={"Retry-After": str(max(1, int(wait + 0.999)))})
+            self.waited += 1
+            await asyncio.sleep(wait)
+
+    def stats(self) -> dict:
+        return {"per_minute": int(self.minute.capacity), "minute_tokens": round(self.minute.level(), 2),
+                "per_day": self.per_day, "spent_today": self.spent, "granted": self.granted,
+                "waited": self.waited, "denied": self.denied}
+
+
+users    = UserLimiter()
+upstream = UpstreamBudget()
+
+
+def stats() -> dict:
+    return {"users": users.stats(), "upstream": upstream.stats()}
@@ -0,0 +1,175 @@
+import os, sys, json, asyncio
+from fastapi import HTTPException
+
+from auth import TIERS, can_use_league
+import cache
+
+# ── Server-side shaping of /football payloads ──────────────────
+#  Query params starting with "_" are ours and never reach api-sports:
+#    _leagues=39,140        keep only these leagues
+#    _fields=fixture.id,goals   keep only these (dotted) keys of each item
+#    _page=2&_per_page=20   page through what is left
+#  On top, every non-admin tier only gets the leagues can_use_league allows
+#  (for SHAPE_LEAGUE_ENDPOINTS). The first shaped request on a cache entry
+#  builds its index — each item of "response" serialised once, positions
+#  grouped by league id — so a variant is a join of pre-encoded items, built
+#  once per (entry, tier, options) and kept on the entry as its own
+#  CacheEntry. ETag, 304, gzip and fixture patches then work on the variant
+#  exactly as on the full payload. Index and variants count toward the
+#  entry's size in the memory cache, so MEM_CACHE_BYTES bounds them too.
+
+SHAPE_LEAGUE_ENDPOINTS = set(filter(None, os.environ.get(
+    "SHAPE_LEAGUE_ENDPOINTS", "fixtures,standings,odds,injuries,predictions").split(",")))
+SHAPE_PER_PAGE  = int(os.environ.get("SHAPE_PER_PAGE", 50))
+SHAPE_PAGE_MAX  = int(os.environ.get("SHAPE_PAGE_MAX", 500))
+SHAPE_MAX_VIEWS = int(os.environ.get("SHAPE_MAX_VIEWS", 16))   # variants kept per cache entry
+
+OPTIONS = ("_leagues", "_fields", "_page", "_per_page")
+_SEP    = (",", ":")
+
+
+class Index:
+    __slots__ = ("head", "items", "by_league", "size")
+
+    def __init__(self, head: dict, parsed: list):
+        self.head      = head
+        self.items     = [json.dumps(i, separators=_SEP).encode() for i in parsed]
+        self.by_league = {}
+        for pos, item in enumerate(parsed):
+            self.by_league.setdefault(league_of(item), []).append(pos)
+        # the encoded items, their slots in items and by_league, and the position ints
+        self.size = sum(map(sys.getsizeof, self.items)) + 44 * len(self.items)
+
+
+def league_of(item):
+    league = item.get("league") if isinstance(item, dict) else None
+    return league.get("id") if isinstance(league, dict) else None
+
+
+# (params for api-sports, our options)
+def split_params(items):
+    params, opts = [], {}
+    for k, v in items:
+        if not k.startswith("_"):
+            params.append((k, v))
+        elif k in OPTIONS:
+            opts[k] = v
+        else:
+            raise HTTPException(400, f"Unknown option {k} — use {', '.join(OPTIONS)}")
+    return params, opts
+
+
+# a league the tier can't see is refused before it costs an upstream call
+def check_league(endpoint: str, params, tier: str):
+    if endpoint not in SHAPE_LEAGUE_ENDPOINTS:
+        return
+    for k, v in params:
+        if k == "league" and v.isdigit() and not can_use_league(int(v), tier):
+            raise HTTPException(403, f"League {v} is not included in the {TIERS[tier]['label']} plan")
+
+
+def _ints(name, raw) -> list:
+    try:
+        return [int(x) for x in raw.split(",") if x.strip()]
+    except ValueError:
+        raise HTTPException(400, f"{name} must be comma-separated integers")
+
+# hashable description of a variant, or None when the full payload is what's wanted.
+# tier is None for admins, who see every league
+def spec_for(endpoint: str, tier, opts: dict):
+    if endpoint not in SHAPE_LEAGUE_ENDPOINTS or TIERS.get(tier, {}).get("league_type") == "all":
+        tier = None
+    leagues = frozenset(_ints("_leagues", opts["_leagues"])) if "_leagues" in opts else None
+    fields  = tuple(f for f in opts.get("_fields", "").split(",") if f.strip()) or None
+    page    = per_page = None
+    if "_page" in opts or "_per_page" in opts:
+        page     = (_ints("_page", opts.get("_page", "1")) or [1])[0]
+        per_page = (_ints("_per_page", opts.get("_per_page", str(SHAPE_PER_PAGE))) or [SHAPE_PER_PAGE])[0]
+        if page < 1 or not 1 <= per_page <= SHAPE_PAGE_MAX:
+            raise HTTPException(400, f"_page must be ≥ 1 and _per_page 1–{SHAPE_PAGE_MAX}")
+    if tier is None and leagues is None and fields is None and page is None:
+        return None
+    return (tier, leagues, fields, page, per_page)
+
+
+# None when the payload has no "response" list to shape
+def index(entry):
+    if entry.index is None:
+        data = entry.data
+        if not (isinstance(data, dict) and isinstance(data.get("response"), list)):
+            entry.index = False
+        else:
+            entry.index = Index({k: v for k, v in data.items() if k != "response"}, data["response"])
+            entry.grew()
+    return entry.index or None
+
+
+def project(item, fields):
+    if not isinstance(item, dict):
+        return item
+    out = {}
+    for f in fields:
+        src, dst, parts = item, out, f.strip().split(".")
+        for i, p in enumerate(parts):
+            if not isinstance(src, dict) or p not in src:
+                break
+            if i == len(parts) - 1 or not isinstance(src[p], dict):
+                dst[p] = src[p]   # leaf, or a list/scalar we can't walk into: whole
+                break
+            src, dst = src[p], dst.setdefault(p, {})
+    return out
+
+
+def _positions(idx: Index, tier, leagues) -> list:
+    keep = [lid for lid in idx.by_league
+            if (leagues is None or lid in leagues)
+            and (tier is None or lid is None or can_use_league(lid, tier))]
+    if len(keep) == len(idx.by_league):
+        return list(range(len(idx.items)))
+    return sorted(pos for lid in keep for pos in idx.by_league[lid])
+
+
+def _render(entry, spec):
+    idx = index(entry)
+    if idx is None:
+        return entry
+    tier, leagues, fields, page, per_page = spec
+    pos   = _positions(idx, tier, leagues)
+    total = len(pos)
+    meta  = {"total": total, "filtered": len(idx.items) - total}
+    if page is not None:
+        pos = pos[(page - 1) * per_page:page * per_page]
+        meta.update(page=page, per_page=per_page, pages=-(-total // per_page))
+    items = [json.dumps(project(json.loads(idx.items[p]), fields), separators=_SEP).encode() for p in pos] \
+            if fields else [idx.items[p] for p in pos]
+    head  = json.dumps({**idx.head, "results": len(items), "shape": meta}, separators=_SEP).encode()
+    raw   = b"".join((head[:-1], b',"response":[', b",".join(items), b"]}"))
+    view  = cache.CacheEntry(entry.key, entry.endpoint, raw, entry.fetched_at)
+    view.owner = entry   # what gets attached to the view later is charged to entry
+    # the same variant of the version this entry replaced, so clients can be sent a patch;
+    # pages shift as items come and go, so those always go out whole
+    prev = entry.prev.views.get(spec) if entry.prev is not None and entry.prev.views and page is None else None
+    if prev is not None and prev.etag != view.etag:
+        view.prev = prev
+    return view
+
+
+def cached(entry, spec):
+    return entry.views.get(spec) if entry.views else None
+
+# CPU-bound the first time per (entry, spec); callers on the event loop use view_async
+def view(entry, spec):
+    v = cached(entry, spec)
+    if v is None:
+        v = _render(entry, spec)
+        views = entry.views = entry.views or {}
+        if len(views) >= SHAPE_MAX_VIEWS:
+            views.pop(next(iter(views)))
+        views[spec] = v
+        entry.grew()
+    return v
+
+async def view_async(entry, spec):
+    if spec is None:
+        return entry
+    return cached(entry, spec) or await asyncio.to_thread(view, entry, spec)
@@ -0,0 +1,77 @@
+import sys, json
+from datetime import datetime
+
+from database import get_db, init_db, rows_to_list, RECONCILE_STATS
+from auth import TIERS
+
+# ── Materialised admin stats ───────────────────────────────────
+#  `stats` holds running counters (users, tier:<name>, disabled, pending_reqs,
+#  unread_notifs) updated in the same transaction as the write that changes
+#  them; `stats_daily` keeps one snapshot row per day for trend charts.
+#  python stats.py reconcile — rebuild both from the source tables.
+
+def tier_delta(old, new) -> dict:
+    d = {}
+    if old:
+        d["tier:" + old] = -1
+    if new:
+        d["tier:" + new] = d.get("tier:" + new, 0) + 1
+    return d
+
+# call inside the caller's transaction; it commits with the change itself
+def apply(db, deltas: dict, new_users: int = 0):
+    items = [(k, v) for k, v in deltas.items() if v]
+    if items:
+        db.executemany("""
+            INSERT INTO stats (key,value) VALUES (?,?)
+            ON CONFLICT(key) DO UPDATE SET value=value+excluded.value
+        """, items)
+    snapshot(db, new_users=new_users)
+
+def read(db) -> dict:
+    return {r["key"]: r["value"] for r in db.execute("SELECT key,value FROM stats").fetchall()}
+
+def tiers_of(counters: dict) -> dict:
+    return {k[5:]: v for k, v in counters.items() if k.startswith("tier:") and v}
+
+def mrr_of(tiers: dict) -> int:
+    return sum(n * TIERS.get(t, {}).get("price", 0) for t, n in tiers.items())
+
+def snapshot(db, date: str = None, new_users: int = 0):
+    date     = date or datetime.utcnow().strftime("%Y-%m-%d")
+    counters = read(db)
+    tiers    = tiers_of(counters)
+    db.execute("""
+        INSERT INTO stats_daily (date,total_users,new_users,pending_reqs,disabled,mrr,tiers,updated_at)
+        VALUES (?,?,?,?,?,?,?,?)
+        ON CONFLICT(date) DO UPDATE SET
+            total_users=excluded.total_users, new_users=new_users+excluded.new_users,
+            pending_reqs=excluded.pending_reqs, disabled=excluded.disabled,
+            mrr=excluded.mrr, tiers=excluded.tiers, updated_at=excluded.updated_at
+    """, (date, counters.get("users", 0), new_users, counters.get("pending_reqs", 0),
+          counters.get("disabled", 0), mrr_of(tiers), json.dumps(tiers), datetime.utcnow().isoformat()))
+
+def history(db, days: int) -> list:
+    rows = rows_to_list(db.execute(
+        "SELECT * FROM stats_daily ORDER BY date DESC LIMIT ?", (days,)
+    ).fetchall())
+    for r in rows:
+        r["tiers"] = json.loads(r["tiers"] or "{}")
+    return rows
+
+def reconcile(db):
+    for sql in RECONCILE_STATS:
+        db.execute(sql)
+    snapshot(db)
+    db.commit()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["reconcile"]:
+        init_db()
+        db = get_db()
+        reconcile(db)
+        print(json.dumps(read(db), indent=2))
+        db.close()
+    else:
+        print("usage: python stats.py reconcile")
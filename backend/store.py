@@ -0,0 +1,313 @@
+import os
+from datetime import datetime, timedelta
+
+from database import get_db, begin_write, rows_to_list
+
+# ── Shared-state backends for the response cache and usage counters ──
+#  cache.py (tier 2), usage.py and auth.py (users_version) talk to `backend`,
+#  never to tables directly.
+#    sqlite — api_cache / api_usage / api_daily_total in DB_PATH (default)
+#    redis  — hashes with key expiry and atomic HINCRBY, so several workers
+#             or nodes share one cache and one set of counters without a
+#             writer lock. STORE_BACKEND=redis, REDIS_URL=redis://host:6379/0
+#  Methods are blocking; async callers go through database.run_db as before.
+#  use(RedisStore(client=...)) swaps in any redis-py compatible client
+#  (fakeredis, a mock) without touching the network.
+
+STORE_BACKEND  = os.environ.get("STORE_BACKEND", "sqlite")
+REDIS_URL      = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+REDIS_PREFIX   = os.environ.get("REDIS_PREFIX", "t3n28:")
+REDIS_USAGE_TTL = int(os.environ.get("REDIS_USAGE_TTL", 90 * 86400))
+
+USAGE_FIELDS = ("count", "cache_hits", "real_calls")
+DAILY_FIELDS = ("total", "cache_hits", "real_calls")
+
+
+class SQLiteStore:
+    name = "sqlite"
+
+    # ── cache ──
+    def cache_get(self, key):
+        db  = get_db()
+        row = db.execute("SELECT endpoint,response,codec,fetched_at FROM api_cache WHERE cache_key=?",
+                         (key,)).fetchone()
+        db.close()
+        return dict(row) if row else None
+
+    def cache_put(self, key, endpoint, blob, codec, fetched_at, uid=None, tier=None, ttl=None):
+        db = get_db()
+        try:
+            begin_write(db, "cache_put")
+            db.execute("""
+                INSERT INTO api_cache (cache_key,endpoint,response,codec,size,fetched_at,accessed_at,fetched_by,fetched_tier)
+                VALUES (?,?,?,?,?,?,?,?,?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    response=excluded.response, codec=excluded.codec, size=excluded.size,
+                    fetched_at=excluded.fetched_at, accessed_at=excluded.accessed_at,
+                    fetched_by=excluded.fetched_by, fetched_tier=excluded.fetched_tier
+            """, (key, endpoint, blob, codec, len(blob), fetched_at, fetched_at, uid, tier))
+            db.commit()
+        finally:   # the pool rolls back a failed write, releasing the lock
+            db.close()
+
+    def cache_delete_prefix(self, prefix) -> int:
+        db = get_db()
+        n  = db.execute("DELETE FROM api_cache WHERE cache_key >= ? AND cache_key < ?",
+                        (prefix, prefix + "\U0010ffff")).rowcount
+        db.commit(); db.close()
+        return n
+
+    def cache_clear(self):
+        db = get_db()
+        db.execute("DELETE FROM api_cache")
+        db.commit(); db.close()
+
+    # touched: key -> ISO last-read stamp. Returns counts for cache.Janitor
+    def cache_sweep(self, touched: dict, max_bytes: int, max_age: int, vacuum_pages: int) -> dict:
+        db = get_db()
+        try:
+            begin_write(db, "cache_sweep")
+            if touched:
+                db.executemany("UPDATE api_cache SET accessed_at=? WHERE cache_key=?",
+                               [(ts, k) for k, ts in touched.items()])
+            cutoff  = (datetime.utcnow() - timedelta(seconds=max_age)).isoformat()
+            expired = db.execute("DELETE FROM api_cache WHERE fetched_at < ?", (cutoff,)).rowcount
+
+            rows, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size),0) FROM api_cache").fetchone()
+            over, victims = total - max_bytes, []
+            if over > 0:
+                for key, size in db.execute("SELECT cache_key,size FROM api_cache ORDER BY accessed_at"):
+                    victims.append((key,))
+                    over  -= size
+                    total -= size
+                    if over <= 0:
+                        break
+                db.executemany("DELETE FROM api_cache WHERE cache_key=?", victims)
+            db.commit()
+
+            vacuumed = 0
+            if db.execute("PRAGMA freelist_count").fetchone()[0]:
+                before = db.execute("PRAGMA page_count").fetchone()[0]
+                db.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})").fetchall()
+                vacuumed = before - db.execute("PRAGMA page_count").fetchone()[0]
+            return {"expired": expired, "evicted": len(victims), "vacuumed": vacuumed,
+                    "rows": rows - len(victims), "bytes": total}
+        finally:
+            db.close()
+
+    # ── usage ──
+    def usage_get(self, uid, date) -> list:
+        db  = get_db()
+        row = db.execute("SELECT count,cache_hits,real_calls FROM api_usage WHERE user_id=? AND date=?",
+                         (uid, date)).fetchone()
+        db.close()
+        return list(row) if row else [0, 0, 0]
+
+    # rows: (uid, email, tier, date, count, hits, real, last_call); daily: (date, total, hits, real).
+    # Returns {(uid, date): [count, hits, real]}: the totals after this add, other workers' included
+    def usage_add(self, rows, daily):
+        db = get_db()
+        try:
+            begin_write(db, "usage_flush")
+            totals = {}
+            for row in rows:   # RETURNING needs execute(), not executemany()
+                totals[(row[0], row[3])] = list(db.execute("""
+                    INSERT INTO api_usage (user_id,email,tier,date,count,cache_hits,real_calls,last_call)
+                    VALUES (?,?,?,?,?,?,?,?)
+                    ON CONFLICT(user_id,date) DO UPDATE SET
+                        count=count+excluded.count, cache_hits=cache_hits+excluded.cache_hits,
+                        real_calls=real_calls+excluded.real_calls,
+                        last_call=excluded.last_call, tier=excluded.tier
+                    RETURNING count,cache_hits,real_calls
+                """, row).fetchone())
+            db.executemany("""
+                INSERT INTO api_daily_total (date,total,cache_hits,real_calls) VALUES (?,?,?,?)
+                ON CONFLICT(date) DO UPDATE SET
+                    total=total+excluded.total, cache_hits=cache_hits+excluded.cache_hits,
+                    real_calls=real_calls+excluded.real_calls
+            """, daily)
+            db.commit()
+        finally:
+            db.close()
+        return totals
+
+    def usage_daily(self, date):
+        db  = get_db()
+        row = db.execute("SELECT date,total,cache_hits,real_calls FROM api_daily_total WHERE date=?",
+                         (date,)).fetchone()
+        db.close()
+        return dict(row) if row else None
+
+    def usage_top(self, date, n=50) -> list:
+        db   = get_db()
+        rows = rows_to_list(db.execute(
+            "SELECT * FROM api_usage WHERE date=? ORDER BY count DESC LIMIT ?", (date, n)
+        ).fetchall())
+        db.close()
+        return rows
+
+    # ── counters shared by every worker on this database ──
+    def counter_get(self, name) -> int:
+        db  = get_db()
+        row = db.execute("SELECT value FROM counters WHERE name=?", (name,)).fetchone()
+        db.close()
+        return row[0] if row else 0
+
+    def counter_bump(self, name) -> int:
+        db = get_db()
+        try:
+            begin_write(db, "counter_bump")
+            value = db.execute("""
+                INSERT INTO counters (name,value) VALUES (?,1)
+                ON CONFLICT(name) DO UPDATE SET value=value+1 RETURNING value
+            """, (name,)).fetchone()[0]
+            db.commit()
+        finally:
+            db.close()
+        return value
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class RedisStore:
+    name = "redis"
+
+    def __init__(self, client=None, url=REDIS_URL, prefix=REDIS_PREFIX):
+        if client is None:
+            import redis   # optional, pip install redis
+            client = redis.Redis.from_url(url)
+        self.r     = client
+        self.p     = prefix
+        self.scans = 0
+
+    def _ck(self, key):        return f"{self.p}cache:{key}"
+    def _uk(self, uid, date):  return f"{self.p}usage:{date}:{uid}"
+    def _rk(self, date):       return f"{self.p}usage_rank:{date}"
+    def _dk(self, date):       return f"{self.p}usage_daily:{date}"
+
+    @staticmethod
+    def _str(v):
+        return v.decode() if isinstance(v, bytes) else v
+
+    def _hash(self, raw: dict) -> dict:
+        return {self._str(k): v for k, v in raw.items()}
+
+    # ── cache: one hash per key, expiring after `ttl` (CACHE_DB_MAX_AGE); size is
+    #    bounded by the server's maxmemory policy (allkeys-lru), not a sweep ──
+    def cache_get(self, key):
+        h = self._hash(self.r.hgetall(self._ck(key)))
+        if not h:
+            return None
+        return {"endpoint": self._str(h["endpoint"]), "response": h["response"],
+                "codec": self._str(h["codec"]), "fetched_at": self._str(h["fetched_at"])}
+
+    def cache_put(self, key, endpoint, blob, codec, fetched_at, uid=None, tier=None, ttl=None):
+        k    = self._ck(key)
+        pipe = self.r.pipeline(transaction=False)
+        pipe.hset(k, mapping={"endpoint": endpoint, "response": blob, "codec": codec, "fetched_at": fetched_at,
+                              "fetched_by": "" if uid is None else uid, "fetched_tier": tier or ""})
+        if ttl:
+            pipe.expire(k, int(ttl))
+        pipe.execute()
+
+    def _scan_delete(self, pattern) -> int:
+        n, batch = 0, []
+        for k in self.r.scan_iter(match=pattern, count=500):
+            batch.append(k)
+            if len(batch) >= 500:
+                n += self.r.delete(*batch); batch = []
+        if batch:
+            n += self.r.delete(*batch)
+        self.scans += 1
+        return n
+
+    def cache_delete_prefix(self, prefix) -> int:
+        escaped = "".join("\\" + ch if ch in "*?[]\\" else ch for ch in prefix)
+        return self._scan_delete(self._ck(escaped) + "*")
+
+    def cache_clear(self):
+        self._scan_delete(self._ck("*"))
+
+    # expiry and maxmemory do the janitor's job; last-read stamps aren't kept
+    def cache_sweep(self, touched, max_bytes, max_age, vacuum_pages) -> dict:
+        return {"expired": 0, "evicted": 0, "vacuumed": 0, "rows": None, "bytes": None}
+
+    # ── usage: HINCRBY per (user, date) hash + a per-day rank zset and totals hash ──
+    def usage_get(self, uid, date) -> list:
+        vals = self.r.hmget(self._uk(uid, date), *USAGE_FIELDS)
+        return [int(v or 0) for v in vals]
+
+    def usage_add(self, rows, daily):
+        pipe = self.r.pipeline(transaction=False)
+        for uid, email, tier, date, count, hits, real, last_call in rows:
+            k = self._uk(uid, date)
+            pipe.hincrby(k, "count", count)
+            pipe.hincrby(k, "cache_hits", hits)
+            pipe.hincrby(k, "real_calls", real)
+            pipe.hset(k, mapping={"user_id": uid, "email": email, "tier": tier, "date": date,
+                                  "last_call": last_call or ""})
+            pipe.expire(k, REDIS_USAGE_TTL)
+            pipe.zincrby(self._rk(date), count, uid)
+            pipe.expire(self._rk(date), REDIS_USAGE_TTL)
+        for date, total, hits, real in daily:
+            k = self._dk(date)
+            pipe.hincrby(k, "total", total)
+            pipe.hincrby(k, "cache_hits", hits)
+            pipe.hincrby(k, "real_calls", real)
+            pipe.expire(k, REDIS_USAGE_TTL)
+        res = pipe.execute()
+        # the three HINCRBY replies per row are the new totals across all workers
+        return {(r[0], r[3]): [int(x) for x in res[i * 7:i * 7 + 3]] for i, r in enumerate(rows)}
+
+    def usage_daily(self, date):
+        h = self._hash(self.r.hgetall(self._dk(date)))
+        if not h:
+            return None
+        return {"date": date, **{f: int(h.get(f, 0)) for f in DAILY_FIELDS}}
+
+    def usage_top(self, date, n=50) -> list:
+        uids = [self._str(u) for u, _ in self.r.zrevrange(self._rk(date), 0, n - 1, withscores=True)]
+        pipe = self.r.pipeline(transaction=False)
+        for uid in uids:
+            pipe.hgetall(self._uk(uid, date))
+        out = []
+        for uid, raw in zip(uids, pipe.execute()):
+            h = {k: self._str(v) for k, v in self._hash(raw).items()}
+            if h:
+                out.append({"user_id": int(uid), "email": h.get("email"), "tier": h.get("tier"), "date": date,
+                            **{f: int(h.get(f, 0)) for f in USAGE_FIELDS}, "last_call": h.get("last_call") or None})
+        return out
+
+    # ── counters ──
+    def counter_get(self, name) -> int:
+        return int(self.r.get(f"{self.p}counter:{name}") or 0)
+
+    def counter_bump(self, name) -> int:
+        return int(self.r.incr(f"{self.p}counter:{name}"))
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "prefix": self.p, "scans": self.scans}
+
+
+def _make():
+    if STORE_BACKEND == "redis":
+        try:
+            return RedisStore()
+        except ImportError:
+            print("⚠️  STORE_BACKEND=redis but redis is not installed — using sqlite")
+    return SQLiteStore()
+
+
+backend = None
+
+def get():
+    global backend
+    if backend is None:
+        backend = _make()
+    return backend
+
+def use(b):
+    global backend
+    backend = b
+    return b
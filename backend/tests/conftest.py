@@ -0,0 +1,8 @@
+import os, sys, tempfile
+
+# backend modules import each other flat (import cache, store …), as under uvicorn
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "test.db"))
+os.environ.setdefault("ADMIN_EMAIL", "admin@example.com")
+os.environ.setdefault("PREFETCH_ENABLED", "0")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
@@ -0,0 +1,53 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import auth, database, main, store
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as c:
+        yield c
+
+def _register(c, email):
+    r = c.post("/auth/register", json={"email": email, "password": "secret1", "name": "T"})
+    assert r.status_code == 200, r.text
+    return r.json()["user_id"], {"Authorization": "Bearer " + r.json()["token"]}
+
+@pytest.fixture(scope="module")
+def admin(client):
+    return _register(client, "admin@example.com")[1]
+
+
+def test_disable_user_refuses_next_request(client, admin):
+    uid, h = _register(client, "disable-me@example.com")
+    assert client.get("/auth/me", headers=h).status_code == 200
+    assert auth.cached_user(uid) is not None
+    r = client.post("/admin/users/status", headers=admin, json={"user_id": uid, "status": "disabled"})
+    assert r.status_code == 200
+    assert client.get("/auth/me", headers=h).status_code == 401
+
+# the change lands through another worker: only the shared users_version tells us
+def test_other_workers_change_is_picked_up(client, monkeypatch):
+    uid, h = _register(client, "other-worker@example.com")
+    assert client.get("/auth/me", headers=h).json()["tier"] == "free"
+    db = database.get_db()
+    db.execute("UPDATE users SET tier='pro' WHERE id=?", (uid,))
+    db.commit(); db.close()
+    store.get().counter_bump("users_version")
+    monkeypatch.setattr(auth, "USER_SYNC_SECS", 0)
+    assert client.get("/auth/me", headers=h).json()["tier"] == "pro"
+
+# a row read before the admin's commit must not be cached after its invalidate_user
+def test_row_read_before_invalidation_is_not_cached(client, monkeypatch):
+    uid, _ = _register(client, "racy@example.com")
+    auth._user_cache.pop(uid, None)
+    read = auth.get_user_by_id
+
+    def read_then_invalidate(u, db=None):
+        row = read(u, db)
+        auth.invalidate_user(u)
+        return row
+    monkeypatch.setattr(auth, "get_user_by_id", read_then_invalidate)
+    assert auth.get_user_cached(uid)["id"] == uid
+    assert auth.cached_user(uid) is None
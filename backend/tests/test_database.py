@@ -0,0 +1,57 @@
+import os, sqlite3, subprocess, sys, tempfile
+
+import database
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INIT    = "import database; database.init_db()"
+
+
+def _version(path):
+    db = sqlite3.connect(path)
+    try:
+        return db.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        db.close()
+
+
+# several workers starting at once on a fresh file must each come up, and
+# every migration must run exactly once between them
+def test_concurrent_init_db_on_fresh_file():
+    for _ in range(3):
+        path  = os.path.join(tempfile.mkdtemp(), "race.db")
+        env   = {**os.environ, "DB_PATH": path}
+        procs = [subprocess.Popen([sys.executable, "-c", INIT], cwd=BACKEND, env=env,
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                 for _ in range(4)]
+        outs  = [p.communicate(timeout=60) for p in procs]
+        for p, (out, err) in zip(procs, outs):
+            assert p.returncode == 0, err
+        assert _version(path) == len(database.MIGRATIONS)
+        for n in range(1, len(database.MIGRATIONS) + 1):
+            assert sum(out.count(f"migrated to v{n}\n") for out, _ in outs) == 1
+
+def test_init_db_is_idempotent():
+    path = os.path.join(tempfile.mkdtemp(), "again.db")
+    env  = {**os.environ, "DB_PATH": path}
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", INIT], cwd=BACKEND, env=env, check=True, capture_output=True)
+    assert _version(path) == len(database.MIGRATIONS)
+    cols = [r[1] for r in sqlite3.connect(path).execute("PRAGMA table_info(api_cache)")]
+    assert cols.count("codec") == 1
+
+# a v3 database that already has some of migration 4's columns still upgrades
+def test_migration_4_tolerates_existing_columns():
+    path = os.path.join(tempfile.mkdtemp(), "v3.db")
+    env  = {**os.environ, "DB_PATH": path}
+    subprocess.run([sys.executable, "-c", INIT], cwd=BACKEND, env=env, check=True, capture_output=True)
+    db = sqlite3.connect(path)
+    db.execute("DROP INDEX idx_api_cache_accessed")
+    db.execute("ALTER TABLE api_cache DROP COLUMN accessed_at")
+    db.execute("ALTER TABLE api_cache DROP COLUMN size")
+    db.execute("PRAGMA user_version=3")
+    db.commit(); db.close()
+
+    subprocess.run([sys.executable, "-c", INIT], cwd=BACKEND, env=env, check=True, capture_output=True)
+    assert _version(path) == len(database.MIGRATIONS)
+    cols = [r[1] for r in sqlite3.connect(path).execute("PRAGMA table_info(api_cache)")]
+    assert [c for c in cols if c in ("codec", "size", "accessed_at")] == ["codec", "size", "accessed_at"]
@@ -0,0 +1,51 @@
+import copy
+
+from diff import apply, diff, item_key
+
+
+def _fx(id, home=0, away=0, **extra):
+    return {"fixture": {"id": id, "status": {"short": "1H"}}, "goals": {"home": home, "away": away}, **extra}
+
+
+def _roundtrip(old, new):
+    before = copy.deepcopy(old)
+    ops    = diff(old, new)
+    assert apply(old, ops) == new
+    assert old == before   # apply works on copies
+    return ops
+
+
+def test_item_key():
+    assert item_key(_fx(7)) == 7
+    assert item_key({"id": 3, "name": "x"}) == 3
+    assert item_key({"name": "x"}) is None
+    assert item_key([1]) is None
+
+def test_unchanged_is_empty():
+    assert _roundtrip([_fx(1), _fx(2)], [_fx(1), _fx(2)]) == []
+
+def test_replace_nested_value():
+    ops = _roundtrip([_fx(1), _fx(2)], [_fx(1, home=1), _fx(2)])
+    assert ops == [{"op": "replace", "id": 1, "path": "/goals/home", "value": 1}]
+
+def test_add_remove_items_and_keys():
+    old = [_fx(1), _fx(2, score={"ht": 1})]
+    new = [_fx(2), _fx(3), _fx(1, events=[{"min": 12}])]
+    ops = _roundtrip(old, new)
+    assert {"op": "add", "id": 1, "path": "/events", "value": [{"min": 12}]} in ops
+    assert {"op": "remove", "id": 2, "path": "/score"} in ops
+    assert {"op": "add", "id": 3, "value": _fx(3)} in ops
+    assert ops[-1] == {"op": "order", "value": [2, 3, 1]}
+
+def test_item_removed_without_reorder():
+    ops = _roundtrip([_fx(1), _fx(2), _fx(3)], [_fx(1), _fx(3)])
+    assert ops == [{"op": "remove", "id": 2}]
+
+def test_keys_needing_escapes():
+    old = [{"id": 1, "a/b": {"c~d": 1}}]
+    new = [{"id": 1, "a/b": {"c~d": 2}}]
+    assert _roundtrip(old, new) == [{"op": "replace", "id": 1, "path": "/a~1b/c~0d", "value": 2}]
+
+def test_not_diffable():
+    assert diff([_fx(1), _fx(1)], [_fx(1)]) is None
+    assert diff([_fx(1)], [{"name": "no key"}]) is None
@@ -0,0 +1,43 @@
+import json, zlib
+
+import cache, envelope
+
+
+def _entry(raw):
+    return cache.CacheEntry("fixtures?live=all", "/fixtures", raw, 0.0)
+
+def _payload(n):
+    return json.dumps({"response": [{"fixture": {"id": i}, "goals": {"home": i % 3}} for i in range(n)]}).encode()
+
+
+def test_gzip_body_is_head_plus_tail():
+    e   = _entry(_payload(200))
+    end = envelope.tail(True, None, 42, 100)
+    gz  = envelope.gzip_body(e, end)
+    assert zlib.decompress(gz, 31) == envelope.OPEN + e.raw + b"," + end
+    assert zlib.decompress(gz, 31) == envelope.body(e, end)
+    out = json.loads(zlib.decompress(gz, 31))
+    assert out["usage"] == {"count": 42, "limit": 100, "remaining": 58}
+    assert out["cache_hit"] is True and out["stale"] is False
+
+def test_gzip_head_built_once_and_reused():
+    e    = _entry(_payload(50))
+    head = envelope.prepare_gzip(e)
+    for count, stale in ((1, None), (90, "revalidating"), (101, "upstream_error")):
+        end = envelope.tail(False, stale, count, 100)
+        assert zlib.decompress(envelope.gzip_body(e, end), 31) == envelope.body(e, end)
+    assert e.gz is head
+
+def test_gzip_trailer_matches_whole_body():
+    e   = _entry(_payload(20))
+    end = envelope.tail(True, None, 5, 10)
+    gz  = envelope.gzip_body(e, end)
+    whole = envelope.body(e, end)
+    assert int.from_bytes(gz[-8:-4], "little") == zlib.crc32(whole)
+    assert int.from_bytes(gz[-4:], "little") == len(whole)
+
+def test_tail_flags():
+    t = json.loads(b"{" + envelope.tail(False, None, 81, 100))
+    assert (t["warn"], t["over_limit"]) == (True, False)
+    t = json.loads(b"{" + envelope.tail(False, None, 101, 100))
+    assert (t["usage"]["remaining"], t["over_limit"]) == (0, True)
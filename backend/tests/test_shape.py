@@ -0,0 +1,67 @@
+import json
+
+import pytest
+from fastapi import HTTPException
+
+import cache, shape
+
+TOP, OTHER = 39, 200   # a top-15 league and one outside it
+
+
+def _entry(items, key="fixtures?date=2026-10-17"):
+    raw = json.dumps({"get": "fixtures", "results": len(items), "response": items}).encode()
+    return cache.CacheEntry(key, "/fixtures", raw, 0.0)
+
+def _fx(id, league):
+    return {"fixture": {"id": id, "venue": {"name": "V", "city": "C"}}, "league": {"id": league},
+            "goals": {"home": 1, "away": 0}, "events": [{"min": 3}]}
+
+ITEMS = [_fx(1, TOP), _fx(2, OTHER), _fx(3, TOP), _fx(4, OTHER), _fx(5, TOP), {"note": "no league"}]
+
+
+def test_positions():
+    idx = shape.Index({}, ITEMS)
+    assert shape._positions(idx, None, None) == [0, 1, 2, 3, 4, 5]
+    assert shape._positions(idx, None, frozenset({TOP})) == [0, 2, 4]
+    assert shape._positions(idx, "starter", None) == [0, 2, 4, 5]   # items without a league stay
+    assert shape._positions(idx, "free", None) == [1, 3, 5]
+    assert shape._positions(idx, "free", frozenset({TOP})) == []
+
+def test_project():
+    item = _fx(1, TOP)
+    assert shape.project(item, ["fixture.id", "goals"]) == {"fixture": {"id": 1}, "goals": {"home": 1, "away": 0}}
+    assert shape.project(item, ["fixture.venue.city", "fixture.id"]) == {"fixture": {"venue": {"city": "C"}, "id": 1}}
+    assert shape.project(item, ["events.min", "missing.x"]) == {"events": [{"min": 3}]}
+    assert shape.project("scalar", ["a"]) == "scalar"
+
+def test_spec_for():
+    assert shape.spec_for("fixtures", "premium", {}) is None
+    assert shape.spec_for("fixtures", "free", {}) == ("free", None, None, None, None)
+    assert shape.spec_for("teams", "free", {"_fields": "team.id"}) == (None, None, ("team.id",), None, None)
+    assert shape.spec_for("fixtures", None, {"_per_page": "2"}) == (None, None, None, 1, 2)
+    for opts in ({"_page": "0"}, {"_per_page": "100000"}, {"_leagues": "39,x"}):
+        with pytest.raises(HTTPException) as e:
+            shape.spec_for("fixtures", None, opts)
+        assert e.value.status_code == 400
+
+def test_paging():
+    e = _entry(ITEMS)
+    pages = [json.loads(shape.view(e, shape.spec_for("fixtures", "starter", {"_page": str(p), "_per_page": "2"})).raw)
+             for p in (1, 2, 3)]
+    assert [[i.get("fixture", {}).get("id") for i in p["response"]] for p in pages] == [[1, 3], [5, None], []]
+    assert pages[0]["shape"] == {"total": 4, "filtered": 2, "page": 1, "per_page": 2, "pages": 2}
+    assert [p["results"] for p in pages] == [2, 2, 0]
+    assert pages[0]["get"] == "fixtures"
+
+def test_view_fields_and_reuse():
+    e    = _entry(ITEMS)
+    spec = shape.spec_for("fixtures", None, {"_leagues": str(OTHER), "_fields": "fixture.id"})
+    v    = shape.view(e, spec)
+    assert json.loads(v.raw)["response"] == [{"fixture": {"id": 2}}, {"fixture": {"id": 4}}]
+    assert json.loads(v.raw)["shape"] == {"total": 2, "filtered": 4}
+    assert shape.view(e, spec) is v
+    assert v.owner is e and v.etag != e.etag
+
+def test_unshapeable_payload_is_passed_through():
+    e = cache.CacheEntry("status", "/status", b'{"response":{"account":1}}', 0.0)
+    assert shape.view(e, ("free", None, None, None, None)) is e
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from upstream import SingleFlight
+
+
+def test_waiters_share_one_call():
+    async def main():
+        sf, calls, gate = SingleFlight(), [], asyncio.Event()
+
+        async def fetch():
+            calls.append(1)
+            await gate.wait()
+            return "payload"
+
+        waiters = [asyncio.ensure_future(sf.do("k", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert sf.in_flight("k")
+        gate.set()
+        results = await asyncio.gather(*waiters)
+        assert results == [("payload", True), ("payload", False), ("payload", False)]
+        assert calls == [1]
+        assert not sf.in_flight("k")
+        assert sf.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 2}
+    asyncio.run(main())
+
+def test_cancelled_waiter_leaves_call_running():
+    async def main():
+        sf, gate = SingleFlight(), asyncio.Event()
+
+        async def fetch():
+            await gate.wait()
+            return "payload"
+
+        leader = asyncio.ensure_future(sf.do("k", fetch))
+        other  = asyncio.ensure_future(sf.do("k", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()   # the client that started the fetch disconnects
+        await asyncio.sleep(0)
+        assert leader.cancelled()
+        assert sf.in_flight("k")
+        gate.set()
+        assert await other == ("payload", False)
+    asyncio.run(main())
+
+def test_error_reaches_every_waiter():
+    async def main():
+        sf, gate = SingleFlight(), asyncio.Event()
+
+        async def fetch():
+            await gate.wait()
+            raise ValueError("upstream 502")
+
+        waiters = [asyncio.ensure_future(sf.do("k", fetch)) for _ in range(2)]
+        await asyncio.sleep(0)
+        gate.set()
+        for w in waiters:
+            with pytest.raises(ValueError):
+                await w
+        assert not sf.in_flight("k")
+    asyncio.run(main())
+
+def test_next_call_after_done_starts_fresh():
+    async def main():
+        sf, n = SingleFlight(), []
+
+        async def fetch():
+            n.append(1)
+            return len(n)
+
+        assert await sf.do("k", fetch) == (1, True)
+        assert await sf.do("k", fetch) == (2, True)
+    asyncio.run(main())
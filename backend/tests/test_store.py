@@ -0,0 +1,152 @@
+import asyncio
+from datetime import datetime
+
+import fakeredis
+import pytest
+
+import cache, database, store, usage
+from store import RedisStore, SQLiteStore
+
+D1, D2 = "2026-10-16", "2026-10-17"
+
+
+@pytest.fixture
+def fake():
+    return fakeredis.FakeRedis()
+
+@pytest.fixture
+def rs(fake):
+    prev = store.backend
+    yield store.use(RedisStore(client=fake, prefix="t:"))
+    store.use(prev)
+
+
+@pytest.fixture
+def sq():
+    database.init_db()
+    prev = store.backend
+    yield store.use(SQLiteStore())
+    store.use(prev)
+
+def _sqlite_user(email):
+    db = database.get_db()
+    db.execute("INSERT OR IGNORE INTO users (email,password_hash) VALUES (?,'x')", (email,))
+    uid = db.execute("SELECT id FROM users WHERE email=?", (email,)).fetchone()[0]
+    db.commit(); db.close()
+    return {"id": uid, "email": email, "tier": "free"}
+
+
+def _row(uid, date, count, hits, real, email=None):
+    return (uid, email or f"u{uid}@x.com", "free", date, count, hits, real, f"{date}T12:00:00")
+
+
+# ── cache ──
+def test_cache_put_get_roundtrip(rs, fake):
+    rs.cache_put("fixtures?live=all", "/fixtures", b"\x78\x9c-blob", "zlib", "2026-10-17T10:00:00",
+                 uid=7, tier="pro", ttl=600)
+    assert rs.cache_get("fixtures?live=all") == {"endpoint": "/fixtures", "response": b"\x78\x9c-blob",
+                                                 "codec": "zlib", "fetched_at": "2026-10-17T10:00:00"}
+    assert 0 < fake.ttl("t:cache:fixtures?live=all") <= 600
+    assert rs.cache_get("fixtures?live=none") is None
+
+def test_cache_put_overwrites(rs):
+    rs.cache_put("k", "/fixtures", b"one", "identity", "2026-10-17T10:00:00")
+    rs.cache_put("k", "/fixtures", b"two", "identity", "2026-10-17T10:05:00")
+    assert rs.cache_get("k")["response"] == b"two"
+    assert rs.cache_get("k")["fetched_at"] == "2026-10-17T10:05:00"
+
+def test_cache_delete_prefix(rs):
+    for k in ("fixtures?live=all", "fixtures?date=2026-10-17", "fixtures?x=[1]*", "standings?league=39"):
+        rs.cache_put(k, "/" + k.split("?")[0], b"{}", "identity", "2026-10-17T10:00:00")
+    # glob characters in the prefix are literal, not a pattern
+    assert rs.cache_delete_prefix("fixtures?x=[1]") == 1
+    assert rs.cache_get("fixtures?live=all") is not None
+    assert rs.cache_delete_prefix("fixtures") == 2
+    assert rs.cache_get("fixtures?date=2026-10-17") is None
+    assert rs.cache_get("standings?league=39") is not None
+
+def test_cache_clear_leaves_usage(rs):
+    rs.cache_put("k", "/fixtures", b"{}", "identity", "2026-10-17T10:00:00")
+    rs.usage_add([_row(1, D2, 1, 1, 0)], [(D2, 1, 1, 0)])
+    rs.cache_clear()
+    assert rs.cache_get("k") is None
+    assert rs.usage_get(1, D2) == [1, 1, 0]
+
+def test_cache_store_and_lookup_through_backend(rs):
+    prev, cache.memory = cache.memory, cache.MemoryCache(1 << 20, 3600)
+    try:
+        raw = b'{"response":[' + b",".join(b'{"n":%d}' % i for i in range(100)) + b"]}"
+        cache.store("fixtures?live=all", "/fixtures", raw)
+        cache.memory.clear()
+        e = asyncio.run(cache.lookup_async("fixtures?live=all"))
+        assert e.raw == raw and e.endpoint == "/fixtures"
+    finally:
+        cache.memory = prev
+
+
+# ── usage ──
+def test_usage_add_returns_totals_per_row(rs):
+    rows = [_row(1, D2, 3, 2, 1), _row(2, D2, 5, 5, 0), _row(1, D1, 7, 1, 6)]
+    assert rs.usage_add(rows, [(D2, 8, 7, 1), (D1, 7, 1, 6)]) == {
+        (1, D2): [3, 2, 1], (2, D2): [5, 5, 0], (1, D1): [7, 1, 6]}
+    # totals are cumulative, whatever else was added in between
+    assert rs.usage_add([_row(2, D2, 1, 0, 1), _row(1, D2, 2, 2, 0)], []) == {
+        (2, D2): [6, 5, 1], (1, D2): [5, 4, 1]}
+    assert rs.usage_get(1, D1) == [7, 1, 6]
+    assert rs.usage_get(3, D2) == [0, 0, 0]
+
+def test_usage_daily(rs):
+    rs.usage_add([_row(1, D2, 3, 2, 1)], [(D2, 3, 2, 1)])
+    rs.usage_add([], [(D2, 0, 0, 4)])
+    assert rs.usage_daily(D2) == {"date": D2, "total": 3, "cache_hits": 2, "real_calls": 5}
+    assert rs.usage_daily(D1) is None
+
+def test_usage_top(rs):
+    rs.usage_add([_row(1, D2, 3, 2, 1), _row(2, D2, 9, 9, 0), _row(3, D2, 5, 0, 5), _row(4, D1, 50, 0, 50)], [])
+    rs.usage_add([_row(1, D2, 4, 4, 0)], [])
+    top = rs.usage_top(D2, n=2)
+    assert [(u["user_id"], u["count"]) for u in top] == [(2, 9), (1, 7)]
+    assert top[1] == {"user_id": 1, "email": "u1@x.com", "tier": "free", "date": D2,
+                      "count": 7, "cache_hits": 6, "real_calls": 1, "last_call": f"{D2}T12:00:00"}
+    assert [u["user_id"] for u in rs.usage_top(D1)] == [4]
+
+def test_aggregator_takes_totals_from_redis(rs):
+    agg  = usage.UsageAggregator()
+    user = {"id": 1, "email": "u1@x.com", "tier": "free"}
+    for hit in (True, True, False):
+        agg.record(user, D2, hit)
+    rs.usage_add([_row(1, D2, 10, 10, 0)], [])   # another worker's flush
+    agg.flush()
+    assert agg.current(1, D2) == {"count": 13, "cache_hits": 12, "real_calls": 1}
+    assert rs.usage_daily(D2)["total"] == 3
+
+
+# ── counters ──
+def test_counters(rs):
+    assert rs.counter_get("users_version") == 0
+    assert [rs.counter_bump("users_version") for _ in range(3)] == [1, 2, 3]
+    assert rs.counter_get("users_version") == 3
+
+
+# ── sqlite ──
+def test_sqlite_usage_add_returns_totals(sq):
+    u = _sqlite_user("sq-totals@x.com")
+    date = "2026-10-15"
+    assert sq.usage_add([_row(u["id"], date, 3, 2, 1)], [(date, 3, 2, 1)]) == {(u["id"], date): [3, 2, 1]}
+    assert sq.usage_add([_row(u["id"], date, 2, 0, 2)], []) == {(u["id"], date): [5, 2, 3]}
+
+# two workers on one database: each one's count includes the other's flushed hits
+# (today's date, since flush drops cached totals for earlier days)
+def test_sqlite_workers_see_each_others_counts(sq):
+    u = _sqlite_user("sq-workers@x.com")
+    date = datetime.utcnow().strftime("%Y-%m-%d")
+    a, b = usage.UsageAggregator(), usage.UsageAggregator()
+    for _ in range(3):
+        a.record(u, date, True)
+    b.record(u, date, False)
+    a.flush()
+    b.flush()
+    assert b.current(u["id"], date)["count"] == 4
+    a.record(u, date, True)
+    a.flush()
+    assert a.current(u["id"], date) == {"count": 5, "cache_hits": 4, "real_calls": 1}
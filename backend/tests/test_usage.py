@@ -0,0 +1,81 @@
+import pytest
+
+import store, usage
+
+D   = "2026-10-17"
+USR = {"id": 1, "email": "u1@x.com", "tier": "free"}
+
+
+# in-memory store; `during` runs inside usage_add, as a request would while the write waits
+class FakeStore:
+    def __init__(self):
+        self.rows   = {}
+        self.during = None
+        self.fail   = False
+
+    def usage_get(self, uid, date):
+        return list(self.rows.get((uid, date), [0, 0, 0]))
+
+    def usage_add(self, rows, daily):
+        if self.during:
+            self.during()
+        if self.fail:
+            raise RuntimeError("database is locked")
+        for uid, _, _, date, count, hits, real, _ in rows:
+            r = self.rows.setdefault((uid, date), [0, 0, 0])
+            r[0] += count; r[1] += hits; r[2] += real
+        return {(r[0], r[3]): list(self.rows[(r[0], r[3])]) for r in rows}
+
+
+@pytest.fixture
+def fs():
+    prev = store.backend
+    yield store.use(FakeStore())
+    store.use(prev)
+
+
+def test_counts_include_pending(fs):
+    agg = usage.UsageAggregator()
+    fs.rows[(1, D)] = [10, 4, 6]
+    assert agg.record(USR, D, True) == 11
+    assert agg.record(USR, D, False) == 12
+    assert agg.current(1, D) == {"count": 12, "cache_hits": 5, "real_calls": 7}
+
+def test_batch_being_written_still_counts(fs):
+    agg  = usage.UsageAggregator()
+    seen = []
+    for _ in range(3):
+        agg.record(USR, D, True)
+    fs.during = lambda: seen.append((agg.current(1, D)["count"], agg.record(USR, D, False)))
+    agg.flush()
+    assert seen == [(3, 4)]
+    assert fs.rows[(1, D)] == [3, 3, 0]
+    assert agg.current(1, D) == {"count": 4, "cache_hits": 3, "real_calls": 1}
+    fs.during = None
+    agg.flush()
+    assert fs.rows[(1, D)] == [4, 3, 1]
+    assert agg.current(1, D)["count"] == 4
+
+def test_failed_flush_rolls_back_and_retries(fs):
+    agg = usage.UsageAggregator()
+    for _ in range(2):
+        agg.record(USR, D, True)
+    fs.fail   = True
+    fs.during = lambda: agg.record(USR, D, False)
+    with pytest.raises(RuntimeError):
+        agg.flush()
+    # nothing counted twice or lost: the failed batch is pending again, with the hit recorded meanwhile
+    assert agg.current(1, D) == {"count": 3, "cache_hits": 2, "real_calls": 1}
+    assert fs.rows == {}
+    fs.fail, fs.during = False, None
+    agg.flush()
+    assert fs.rows[(1, D)] == [3, 2, 1]
+    assert agg.current(1, D)["count"] == 3
+    assert agg.flushes == 1
+
+def test_flush_folds_in_other_workers(fs):
+    agg = usage.UsageAggregator()
+    agg.record(USR, D, True)
+    fs.rows[(1, D)] = [20, 0, 20]   # flushed elsewhere after this worker read its base
+    agg.flush()
+    assert agg.current(1, D)["count"] == 21
@@ -0,0 +1,157 @@
+import os, time, asyncio, httpx
+from urllib.parse import urlsplit
+from fastapi import HTTPException
+
+import cache, ratelimit, metrics
+from database import run_db
+
+FOOTBALL_API_KEY  = os.environ.get("FOOTBALL_API_KEY", "9840d945cf9472498c43556397d6386f")
+FOOTBALL_API_BASE = os.environ.get("FOOTBALL_API_BASE", "https://v3.football.api-sports.io").rstrip("/")
+
+UPSTREAM_TIMEOUT         = float(os.environ.get("UPSTREAM_TIMEOUT", 15))
+UPSTREAM_MAX_CONNECTIONS = int(os.environ.get("UPSTREAM_MAX_CONNECTIONS", 20))
+UPSTREAM_MAX_KEEPALIVE   = int(os.environ.get("UPSTREAM_MAX_KEEPALIVE", 10))
+UPSTREAM_KEEPALIVE_SECS  = float(os.environ.get("UPSTREAM_KEEPALIVE_SECS", 60))
+UPSTREAM_PER_HOST        = int(os.environ.get("UPSTREAM_PER_HOST", 8))
+UPSTREAM_HTTP2           = os.environ.get("UPSTREAM_HTTP2", "0") == "1"
+
+
+# ── Single-flight: one upstream fetch per key, shared by every waiter ──
+class SingleFlight:
+    def __init__(self):
+        self.leaders   = 0
+        self.coalesced = 0
+        self._calls    = {}
+
+    # returns (result, leader) — every waiter gets the leader's result or its error
+    async def do(self, key, fn):
+        task, leader = self._calls.get(key), False
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._done(key, t))
+            self._calls[key] = task
+            self.leaders += 1
+            leader = True
+        else:
+            self.coalesced += 1
+        # shield: a disconnecting caller must not cancel the fetch the others wait on
+        return await asyncio.shield(task), leader
+
+    def in_flight(self, key) -> bool:
+        return key in self._calls
+
+    def _done(self, key, task):
+        self._calls.pop(key, None)
+        if not task.cancelled():
+            task.exception()   # mark retrieved even if every waiter went away
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "leaders": self.leaders,
+                "coalesced": self.coalesced}
+
+
+flights = SingleFlight()
+
+
+# ── Shared client: one keep-alive pool for the whole app lifetime ──
+_client     = None
+_http2      = False
+_host_slots = {}
+_pool       = {"requests": 0, "in_use": 0, "wait_total": 0.0, "wait_max": 0.0}
+
+
+async def start():
+    global _client, _http2
+    if _client is not None:
+        return
+    http2 = UPSTREAM_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401 — optional, pip install httpx[http2]
+        except ImportError:
+            print("⚠️  UPSTREAM_HTTP2=1 but h2 is not installed — using HTTP/1.1")
+            http2 = False
+    _http2  = http2
+    _client = httpx.AsyncClient(
+        timeout=UPSTREAM_TIMEOUT,
+        http2=http2,
+        headers={"x-apisports-key": FOOTBALL_API_KEY},
+        limits=httpx.Limits(max_connections=UPSTREAM_MAX_CONNECTIONS,
+                            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+                            keepalive_expiry=UPSTREAM_KEEPALIVE_SECS),
+    )
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def fetch(path: str, params=None) -> httpx.Response:
+    if _client is None:
+        await start()
+    url  = f"{FOOTBALL_API_BASE}/{path}"
+    host = urlsplit(url).netloc
+    slot = _host_slots.get(host)
+    if slot is None:
+        slot = _host_slots[host] = asyncio.Semaphore(UPSTREAM_PER_HOST)
+
+    t0 = time.perf_counter()
+    async with slot:
+        waited = time.perf_counter() - t0
+        _pool["requests"]   += 1
+        _pool["wait_total"] += waited
+        _pool["wait_max"]    = max(_pool["wait_max"], waited)
+        _pool["in_use"]     += 1
+        outcome = "error"
+        try:
+            r = await _client.get(url, params=params)
+            outcome = "ok" if r.status_code == 200 else str(r.status_code)
+        except httpx.TimeoutException:
+            outcome = "timeout"
+            raise HTTPException(504, "Football API timeout — try again")
+        except httpx.HTTPError:
+            raise HTTPException(502, "Football API unreachable — try again")
+        finally:
+            _pool["in_use"] -= 1
+            metrics.UPSTREAM.labels(path, outcome).observe(time.perf_counter() - t0)
+    if r.status_code != 200:
+        raise HTTPException(r.status_code, f"Football API returned {r.status_code}")
+    return r
+
+
+# ── Fetch-into-cache, shared by the proxy, revalidation and prefetch ──
+def refresher(cache_key, endpoint, params, ttl, uid=None, tier=None):
+    async def refresh():
+        fresh = cache.memory.get(cache_key)
+        if fresh and fresh.age() < ttl:
+            return fresh, False
+        await ratelimit.upstream.acquire(tier)
+        r = await fetch(endpoint, params)
+        return await run_db(cache.store, cache_key, "/"+endpoint, r.content, uid, tier), True
+    return refresh
+
+
+def pool_stats() -> dict:
+    # httpcore keeps its connections on the transport's pool; absent before start()
+    conns = getattr(getattr(getattr(_client, "_transport", None), "_pool", None), "connections", [])
+    idle  = sum(1 for c in conns if c.is_idle())
+    n     = _pool["requests"]
+    return {
+        "http2":           _http2,
+        "max_connections": UPSTREAM_MAX_CONNECTIONS,
+        "max_keepalive":   UPSTREAM_MAX_KEEPALIVE,
+        "per_host_limit":  UPSTREAM_PER_HOST,
+        "connections":     len(conns),
+        "idle":            idle,
+        "in_use":          _pool["in_use"],
+        "requests":        n,
+        "avg_wait_ms":     round(_pool["wait_total"] / n * 1000, 2) if n else 0.0,
+        "max_wait_ms":     round(_pool["wait_max"] * 1000, 2),
+    }
+
+
+def stats() -> dict:
+    return {"single_flight": flights.stats(), "pool": pool_stats()}
@@ -0,0 +1,179 @@
+import os, threading, asyncio
+from datetime import datetime
+
+from database import run_db
+import store as backends
+
+# ── Write-behind usage accounting ──────────────────────────────
+#  Hits are counted in memory per (user, date) and flushed to the shared
+#  store (store.py: api_usage / api_daily_total, or redis HINCRBY) in one batch
+#  every USAGE_FLUSH_SECS, when USAGE_FLUSH_MAX rows are pending, and on
+#  shutdown. Counts read back here include the unflushed part and the batch
+#  being written, so DAILY_LIMITS checks stay exact; each flush returns the
+#  stored totals, which fold in what other workers counted (a user's count
+#  here lags theirs by at most one flush interval).
+
+USAGE_FLUSH_SECS = float(os.environ.get("USAGE_FLUSH_SECS", 5))
+USAGE_FLUSH_MAX  = int(os.environ.get("USAGE_FLUSH_MAX", 500))
+
+
+class UsageAggregator:
+    def __init__(self, flush_secs=USAGE_FLUSH_SECS, flush_max=USAGE_FLUSH_MAX):
+        self.flush_secs = flush_secs
+        self.flush_max  = flush_max
+        self.flushes    = 0
+        self.rows       = 0
+        self._base      = {}   # (uid, date) -> [count, cache_hits, real_calls] already in the store
+        self._pending   = {}   # (uid, date) -> [email, tier, count, cache_hits, real_calls, last_call]
+        self._daily     = {}   # date -> [total, cache_hits, real_calls]
+        self._lock      = threading.Lock()
+        self._wake      = None
+        self._task      = None
+
+    def _persisted(self, uid, date):
+        key = (uid, date)
+        if key not in self._base:
+            row = backends.get().usage_get(uid, date)
+            with self._lock:
+                self._base.setdefault(key, row)
+        return self._base[key]
+
+    def current(self, uid, date) -> dict:
+        base = self._persisted(uid, date)
+        with self._lock:
+            p = self._pending.get((uid, date))
+            count, hits, real = base
+            if p:
+                count, hits, real = count + p[2], hits + p[3], real + p[4]
+        return {"count": count, "cache_hits": hits, "real_calls": real}
+
+    # returns the user's count for the day including this hit
+    def record(self, user, date, cache_hit, n=1) -> int:
+        return self.record_split(user, date, *((n, 0) if cache_hit else (0, n)))
+
+    # several hits at once (POST /football/batch): `hit` from cache, `real` upstream
+    def record_split(self, user, date, hit, real) -> int:
+        n    = hit + real
+        base = self._persisted(user["id"], date)
+        with self._lock:
+            p = self._pending.get((user["id"], date))
+            if p is None:
+                p = self._pending[(user["id"], date)] = [user["email"], user["tier"], 0, 0, 0, None]
+            p[1]  = user["tier"]
+            p[2] += n
+            p[3] += hit
+            p[4] += real
+            p[5]  = datetime.utcnow().isoformat()
+            self._bump_daily(date, n, hit, real)
+            count   = base[0] + p[2]
+            pending = len(self._pending)
+        if pending >= self.flush_max and self._wake is not None:
+            self._wake.set()
+        return count
+
+    # event-loop callers: load the persisted count off-loop the first time
+    async def record_async(self, user, date, cache_hit, n=1) -> int:
+        if (user["id"], date) not in self._base:
+            await run_db(self._persisted, user["id"], date)
+        return self.record(user, date, cache_hit, n)
+
+    async def record_split_async(self, user, date, hit, real) -> int:
+        if (user["id"], date) not in self._base:
+            await run_db(self._persisted, user["id"], date)
+        return self.record_split(user, date, hit, real)
+
+    async def count_async(self, uid, date) -> int:
+        if (uid, date) not in self._base:
+            await run_db(self._persisted, uid, date)
+        return self.current(uid, date)["count"]
+
+    # a real upstream call no user request paid for (revalidation, prefetch)
+    def record_background(self, date):
+        with self._lock:
+            self._bump_daily(date, 0, 0, 1)
+
+    def _bump_daily(self, date, total, hits, real):
+        d = self._daily.setdefault(date, [0, 0, 0])
+        d[0] += total; d[1] += hits; d[2] += real
+
+    def flush(self):
+        with self._lock:
+            pending, daily = self._pending, self._daily
+            self._pending, self._daily = {}, {}
+            # counted as persisted from here on, so reads during the write (which
+            # can wait out busy_timeout) still include it; undone if it fails
+            self._shift(pending, 1)
+        if not pending and not daily:
+            return
+        try:
+            totals = backends.get().usage_add(
+                [(uid, p[0], p[1], date, p[2], p[3], p[4], p[5]) for (uid, date), p in pending.items()],
+                [(date, *d) for date, d in daily.items()])
+        except Exception:
+            with self._lock:
+                self._shift(pending, -1)
+            self._merge_back(pending, daily)
+            raise
+
+        today = datetime.utcnow().strftime("%Y-%m-%d")
+        with self._lock:
+            for key in pending:
+                if totals and key in totals:
+                    # new totals include this flush and other workers'; hits recorded since are still pending
+                    self._base[key] = totals[key]
+            for key in [k for k in self._base if k[1] < today]:
+                del self._base[key]
+            self.flushes += 1
+            self.rows    += len(pending)
+
+    # caller holds the lock
+    def _shift(self, pending, sign):
+        for key, p in pending.items():
+            b = self._base.setdefault(key, [0, 0, 0])
+            b[0] += sign * p[2]; b[1] += sign * p[3]; b[2] += sign * p[4]
+
+    def _merge_back(self, pending, daily):
+        with self._lock:
+            for key, p in pending.items():
+                cur = self._pending.get(key)
+                if cur is None:
+                    self._pending[key] = p
+                else:
+                    cur[2] += p[2]; cur[3] += p[3]; cur[4] += p[4]
+            for date, d in daily.items():
+                self._bump_daily(date, *d)
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_secs)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await run_db(self.flush)
+            except Exception as e:   # rows were merged back; retry next round
+                print(f"⚠️  usage flush failed: {e!r}")
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await run_db(self.flush)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pending_rows": len(self._pending), "tracked_users": len(self._base),
+                    "flushes": self.flushes, "rows_flushed": self.rows}
+
+
+aggregator = UsageAggregator()
@@ -47,8 +47,19 @@ const api = {
   get:    (path)       => _req('GET',    path),
   post:   (path, body) => _req('POST',   path, body),
   delete: (path)       => _req('DELETE', path),
+  download: _download,
 };
 
+// Authenticated file download (CSV/NDJSON exports) saved via a temporary link
+async function _download(path, filename) {
+  const r = await fetch(API_BASE + path, { headers: { 'Authorization': 'Bearer ' + Auth.getToken() } });
+  if (!r.ok) throw new Error(`Export failed (${r.status})`);
+  const url = URL.createObjectURL(await r.blob());
+  const a = Object.assign(document.createElement('a'), { href: url, download: filename });
+  document.body.appendChild(a); a.click(); a.remove();
+  URL.revokeObjectURL(url);
+}
+
 // ── Auth calls ────────────────────────────────────────────────
 async function authRegister(email, password, name, whatsapp, interestedTier) {
   const data = await _req('POST', '/auth/register', {
@@ -81,10 +92,30 @@ function _saveSession(data) {
 }
 
 // ── Football API (proxied through backend) ────────────────────
+// Last payload + ETag per endpoint: the server answers 304 when it's unchanged
+// and 226 with a patch (applyPatch) when it only moved on by one refresh
+const _fbVersions = new Map();
+
 async function footballGet(endpoint) {
   // endpoint like: /fixtures?live=all
   const path = '/football' + endpoint;
-  const data = await api.get(path);
+  const held = _fbVersions.get(path);
+  const headers = { 'Authorization': 'Bearer ' + (Auth.getToken() || ''), 'A-IM': 'fixture-patch' };
+  if (held) headers['If-None-Match'] = held.etag;
+
+  const r = await fetch(API_BASE + path, { headers, cache: 'no-store' });
+  if (r.status === 304 && held) return held.data;
+  if (r.status === 401) return api.get(path);   // shared session-expiry handling
+  const data = await r.json();
+  if (!r.ok) throw new Error(data.detail || `Error ${r.status}`);
+
+  if (r.status === 226 && held) {
+    held.data.response = applyPatch(held.data.response || [], data.patch.ops);
+    held.data.results  = held.data.response.length;
+    data.data = held.data;
+  }
+  const etag = r.headers.get('ETag');
+  if (etag) _fbVersions.set(path, { etag, data: data.data });
 
   // Show usage warning if near/over limit
   if (data.warn || data.over_limit) {
@@ -97,6 +128,25 @@ async function footballGet(endpoint) {
   return data.data; // return the actual football API response
 }
 
+// Several endpoints in one POST /football/batch. Resolves to one entry per
+// endpoint, in order: the payload, or an Error for a path that failed
+async function footballBatch(endpoints) {
+  const etags = {};
+  endpoints.forEach(e => { const held = _fbVersions.get('/football' + e); if (held) etags[e] = held.etag; });
+  const data = await api.post('/football/batch', { paths: endpoints, etags });
+
+  _updateUsagePill(data.usage);
+  if (data.warn || data.over_limit) _showUsageWarning(data.usage, data.over_limit);
+
+  return data.results.map(it => {
+    const path = '/football' + it.path;
+    if (it.status === 304) return _fbVersions.get(path).data;
+    if (it.status !== 200)  return new Error(it.detail || `Error ${it.status}`);
+    _fbVersions.set(path, { etag: it.etag, data: it.data });
+    return it.data;
+  });
+}
+
 // ── Usage UI ──────────────────────────────────────────────────
 function _updateUsagePill(usage) {
   if (!usage) return;
@@ -157,6 +207,53 @@ async function loadUsagePill() {
   } catch(e) { return null; }
 }
 
+// ── Live fixtures push (/live/stream) ─────────────────────────
+// Calls onUpdate(data) with the same shape footballGet('/fixtures?live=all')
+// returns: once from the snapshot, then after every patch. Returns a stop().
+function liveStream(onUpdate) {
+  let state = null, es = null, stopped = false;
+  const open = () => {
+    es = new EventSource(API_BASE + '/live/stream?token=' + encodeURIComponent(Auth.getToken() || ''));
+    es.addEventListener('snapshot', e => {
+      state = { version: e.lastEventId, data: JSON.parse(e.data) };
+      onUpdate(state.data);
+    });
+    es.addEventListener('patch', e => {
+      const p = JSON.parse(e.data);
+      if (!state || p.from !== state.version) {      // missed an update — start over with a snapshot
+        if (state && p.to === state.version) return;
+        state = null; es.close(); if (!stopped) open();
+        return;
+      }
+      state.data.response = applyPatch(state.data.response || [], p.ops);
+      state.data.results  = state.data.response.length;
+      state.version = p.to;
+      onUpdate(state.data);
+    });
+  };
+  open();
+  return () => { stopped = true; es && es.close(); };
+}
+
+// Mirrors backend/diff.py apply(): items keyed by fixture.id
+function applyPatch(items, ops) {
+  const keyOf = it => it?.fixture?.id ?? it?.id;
+  let byKey = new Map(items.map(it => [keyOf(it), it]));
+  for (const op of ops) {
+    if (op.op === 'order') { byKey = new Map(op.value.map(k => [k, byKey.get(k)])); continue; }
+    if (!op.path) {
+      if (op.op === 'remove') byKey.delete(op.id); else byKey.set(op.id, op.value);
+      continue;
+    }
+    const parts = op.path.split('/').slice(1).map(p => p.replace(/~1/g, '/').replace(/~0/g, '~'));
+    const last  = parts.pop();
+    let node = byKey.get(op.id);
+    for (const p of parts) node = node[p];
+    if (op.op === 'remove') delete node[last]; else node[last] = op.value;
+  }
+  return [...byKey.values()];
+}
+
 // ── Tier helpers ──────────────────────────────────────────────
 const TOP15_IDS = Auth.getUser()?.top15_ids ||
   [39,140,135,78,61,2,3,88,94,144,253,45,848,4,1];